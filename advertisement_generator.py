@@ -12,6 +12,7 @@ import logging
 import os
 import boto3
 import math
+import numpy as np
 from pdf_generator import PDFBrochureGenerator
 from pathlib import Path
 
@@ -65,11 +66,7 @@ class AdvertisementGenerator:
                     
     def get_relevant_products(self, query: str, k: int = 3) -> List[Dict]:
         """Get relevant products based on query"""
-        response = self.client.embeddings.create(
-            input=query,
-            model=self.embedding_generator.model
-        )
-        query_embedding = response.data[0].embedding
+        query_embedding = self.embedding_generator.embed_query(query)
         results = self.vector_store.search(query_embedding, k)
         return results
     
@@ -380,28 +377,20 @@ class AdvertisementGenerator:
 
     def create_gradient_background(self, width, height, start_color, end_color, direction='vertical'):
         """Create a gradient background"""
-        img = Image.new('RGB', (width, height))
-        draw = ImageDraw.Draw(img)
+        start_rgb = np.array(self.hex_to_rgb(start_color), dtype=np.float64)
+        end_rgb = np.array(self.hex_to_rgb(end_color), dtype=np.float64)
         
-        start_rgb = self.hex_to_rgb(start_color)
-        end_rgb = self.hex_to_rgb(end_color)
+        # Una rampa de colores (una fila/columna por paso) y broadcast a toda la imagen
+        steps = height if direction == 'vertical' else width
+        ratio = (np.arange(steps, dtype=np.float64) / steps)[:, None]
+        ramp = (start_rgb * (1 - ratio) + end_rgb * ratio).astype(np.uint8)
         
         if direction == 'vertical':
-            for y in range(height):
-                ratio = y / height
-                r = int(start_rgb[0] * (1 - ratio) + end_rgb[0] * ratio)
-                g = int(start_rgb[1] * (1 - ratio) + end_rgb[1] * ratio)
-                b = int(start_rgb[2] * (1 - ratio) + end_rgb[2] * ratio)
-                draw.line([(0, y), (width, y)], fill=(r, g, b))
+            pixels = np.broadcast_to(ramp[:, None, :], (height, width, 3))
         else:  # horizontal
-            for x in range(width):
-                ratio = x / width
-                r = int(start_rgb[0] * (1 - ratio) + end_rgb[0] * ratio)
-                g = int(start_rgb[1] * (1 - ratio) + end_rgb[1] * ratio)
-                b = int(start_rgb[2] * (1 - ratio) + end_rgb[2] * ratio)
-                draw.line([(x, 0), (x, height)], fill=(r, g, b))
+            pixels = np.broadcast_to(ramp[None, :, :], (height, width, 3))
         
-        return img
+        return Image.fromarray(np.ascontiguousarray(pixels))
     
     def load_fonts(self):
         """Load fonts with proper fallback"""
@@ -479,10 +468,10 @@ class AdvertisementGenerator:
         img = self.create_gradient_background(width, height, '#667eea', '#764ba2')
         
         overlay = Image.new('RGBA', (width, height), (255, 255, 255, 20))
+        draw_overlay = ImageDraw.Draw(overlay)
         for i in range(0, width, 50):
             for j in range(0, height, 50):
                 if (i + j) % 100 == 0:
-                    draw_overlay = ImageDraw.Draw(overlay)
                     draw_overlay.ellipse([i-10, j-10, i+10, j+10], fill=(255, 255, 255, 30))
         
         img = Image.alpha_composite(img.convert('RGBA'), overlay).convert('RGB')
@@ -874,6 +863,23 @@ class AdvertisementGenerator:
             logger.error(f"Error getting promotion: {e}")
             return None
 
+    def get_products_bulk(self, product_names: List[str]) -> Dict[str, Optional[ProductInfo]]:
+        """Get several products by name in one round-trip; {} on error"""
+        try:
+            return self.db_manager.get_products_data(product_names)
+        except Exception as e:
+            logger.error(f"Error getting products in bulk: {e}")
+            return {}
+
+    def get_promotions_bulk(self, promo_ids: List[int]) -> Dict[int, Optional[Dict]]:
+        """Get several promotions by id in one round-trip; missing ids map to None"""
+        try:
+            promotions = self.db_manager.get_promotions_data(promo_ids)
+        except Exception as e:
+            logger.error(f"Error getting promotions in bulk: {e}")
+            return {}
+        return {promo_id: promotions.get(promo_id) for promo_id in promo_ids}
+
     def create_personalized_ad(self, interest: Dict) -> Optional[str]:
         """Create personalized advertisement image for client"""
         try:
@@ -940,7 +946,7 @@ class AdvertisementGenerator:
             
             promocion = self.get_promotion(interest['entidad_id'])
             if promocion:
-                logger.info(f"producto promociones: {promocion}")
+                logger.info("producto promociones: %s", promocion)
                 self.create_simple_promotion_banner(
                     promotion_info=promocion,
                     output_path=temp_path
@@ -982,28 +988,20 @@ class AdvertisementGenerator:
     def create_pdf_brochure_for_client(self, client_name: str, client_interests: List[Dict]) -> Optional[str]:
         """Create and upload PDF brochure for client"""
         try:
-            logger.info(f"Creating PDF brochure for client: {client_name}")
+            logger.info("Creating PDF brochure for client: %s", client_name)
             
-            # Create PDF brochure
-            pdf_path = self.pdf_generator.create_brochure_for_client(client_name, client_interests)
-            
-            if not pdf_path:
-                logger.error("Failed to create PDF brochure")
-                return None
-            
-            # Upload to AWS
-            public_url = self.pdf_generator.save_pdf_to_aws(pdf_path, client_name)
-            
-            # Clean up temporary file
-            try:
-                os.unlink(pdf_path)
-            except Exception as e:
-                logger.warning(f"Could not delete temp PDF file: {e}")
-            
-            # Clean up any other temp files
-            self.pdf_generator.cleanup_temp_files()
+            # Create PDF brochure; intermediate images are removed when the block exits
+            with self.pdf_generator:
+                pdf_buffer = self.pdf_generator.create_brochure_buffer(client_name, client_interests)
+                
+                if pdf_buffer is None:
+                    logger.error("Failed to create PDF brochure")
+                    return None
+                
+                # Upload to AWS straight from memory
+                public_url = self.pdf_generator.save_pdf_to_aws_fileobj(pdf_buffer, client_name)
             
-            logger.info(f"PDF brochure created and uploaded successfully: {public_url}")
+            logger.info("PDF brochure created and uploaded successfully: %s", public_url)
             
             return public_url
             
@@ -1017,11 +1015,11 @@ class AdvertisementGenerator:
             public_url = self.create_pdf_brochure_for_client(client_name, client_interests)
             
             if public_url:
-                logger.info(f"PDF brochure created successfully for {client_name}: {public_url}")
+                logger.info("PDF brochure created successfully for %s: %s", client_name, public_url)
 
                 intereses_ids = [interest['id'] for interest in client_interests]
                 # intereses_ids_str = ','.join(map(str, intereses_ids))
-                logger.info(f"intereses_ids: {intereses_ids}")
+                logger.info("intereses_ids: %s", intereses_ids)
                 self.db_manager.intereses_procesados(intereses_ids)
 
                 return public_url
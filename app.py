@@ -4,6 +4,11 @@ import psycopg2.extras
 from datetime import datetime
 import logging
 import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 from twilio.rest import Client
 from twilio.twiml.messaging_response import MessagingResponse
@@ -36,29 +41,137 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+############ COLA DE MENSAJES ############
+# El webhook encola y espera a que el mensaje quede guardado; un hilo consume lotes
+# de hasta BATCH_MAX_ITEMS mensajes (o lo que llegue en BATCH_MAX_WAIT segundos),
+# los guarda con un único INSERT y responde a cada cliente por la API de Twilio
+BATCH_MAX_ITEMS = 64
+BATCH_MAX_WAIT = 0.05
+# Máximo que el webhook espera al guardado antes de pedir a Twilio que reintente
+STORE_TIMEOUT = 10
+
+message_queue = queue.Queue()
+
+# MessageSid de los mensajes ya encolados: Twilio reintenta el webhook con el
+# mismo MessageSid si no recibe respuesta a tiempo
+RECENT_SIDS_SIZE = 256
+recent_message_sids = OrderedDict()
+recent_message_sids_lock = threading.Lock()
+
+def is_duplicate_message(message_sid):
+    if not message_sid:
+        return False
+    with recent_message_sids_lock:
+        if message_sid in recent_message_sids:
+            return True
+        recent_message_sids[message_sid] = True
+        if len(recent_message_sids) > RECENT_SIDS_SIZE:
+            recent_message_sids.popitem(last=False)
+    return False
+
+def forget_message_sid(message_sid):
+    # El mensaje no se guardó: el reintento de Twilio no debe tratarse como duplicado
+    if not message_sid:
+        return
+    with recent_message_sids_lock:
+        recent_message_sids.pop(message_sid, None)
+
+def drain_message_batch():
+    items = [message_queue.get()]
+    deadline = time.monotonic() + BATCH_MAX_WAIT
+    while len(items) < BATCH_MAX_ITEMS:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            items.append(message_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return items
+
+def send_reply(result):
+    if result['success']:
+        logger.info("Respuesta generada: %s", result['response'])
+        body = result['response']
+    else:
+        logger.error("Error procesando mensaje: %s", result['error'])
+        body = 'Gracias por tu mensaje, te contestaremos enseguida!'
+    try:
+        client.messages.create(
+            from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
+            to=f"whatsapp:{result['telefono']}",
+            body=body
+        )
+    except Exception as e:
+        logger.error(f"Error enviando respuesta a {result['telefono']}: {e}")
+
+def message_worker():
+    while True:
+        items = drain_message_batch()
+        # Los webhooks que ya respondieron 500 cancelaron su entrada: no se guardan,
+        # el reintento de Twilio los traerá de nuevo
+        items = [item for item in items if item[4].set_running_or_notify_cancel()]
+        if not items:
+            continue
+        
+        def on_stored(stored):
+            # Libera los webhooks del lote: confirman a Twilio o piden reintento
+            for item, ok in zip(items, stored):
+                if ok:
+                    item[4].set_result(True)
+                else:
+                    item[4].set_exception(RuntimeError("No se pudo guardar el mensaje"))
+        
+        try:
+            # Solo bloquea hasta guardar el lote; las respuestas siguen en el executor
+            bot.process_message_batch([item[:4] for item in items], on_stored=on_stored, on_result=send_reply)
+        except Exception as e:
+            logger.error(f"Error procesando lote de mensajes: {e}")
+            for item in items:
+                if not item[4].done():
+                    item[4].set_exception(e)
+
+if bot is not None:
+    threading.Thread(target=message_worker, name="message-worker", daemon=True).start()
+else:
+    logger.error("Sistema no inicializado: el webhook responderá 503")
+
 ############ ENDPOINTS ############
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Manejar mensajes entrantes de WhatsApp desde Twilio"""
+    if bot is None:
+        return jsonify({"error": "Sistema no disponible"}), 503
     try:
         incoming_msg = request.form.get('Body', '')
         wa_id = request.form.get('From', '').replace('whatsapp:', '')
         nombre = request.form.get('ProfileName', None)
+        message_sid = request.form.get('MessageSid')
+        
+        if is_duplicate_message(message_sid):
+            logger.info(f"Mensaje duplicado de {wa_id} ignorado")
+            return str(MessagingResponse())
         
         logger.info(f"Mensaje recibido de {wa_id}: {incoming_msg}")
-        result = bot.process_client_message(wa_id, incoming_msg, nombre)
+        stored = Future()
+        message_queue.put((wa_id, incoming_msg, nombre, datetime.now(), stored))
+        try:
+            # Solo se confirma a Twilio cuando el mensaje ya está en la BD
+            try:
+                stored.result(timeout=STORE_TIMEOUT)
+            except FutureTimeoutError:
+                # Si sigue en la cola se cancela para que no se guarde después del 500;
+                # si el worker ya lo tomó, el guardado está en curso y se espera su resultado
+                if stored.cancel():
+                    raise
+                stored.result()
+        except Exception as e:
+            forget_message_sid(message_sid)
+            logger.error(f"Mensaje de {wa_id} no guardado: {e!r}")
+            return jsonify({"error": "Mensaje no guardado"}), 500
         
-        if result['success']:
-            logger.info(f"Respuesta generada: {result['response']}")
-            resp = MessagingResponse()
-            resp.message(result['response'])
-        else :
-            logger.error(f"Error procesando mensaje: {result['error']}")
-            resp = MessagingResponse()
-            resp.message('Gracias por tu mensaje, te contestaremos enseguida!')
-            return jsonify({"error": result['error']}), 500
-
-        return str(resp)
+        # La respuesta se envía desde message_worker; aquí solo se confirma la recepción
+        return str(MessagingResponse())
     
     except Exception as e:
         logger.error(f"Error en webhook: {e}")
@@ -4,6 +4,9 @@ from datetime import datetime, date
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 import pickle
+import hashlib
+import threading
+from collections import OrderedDict
 import faiss
 # from sentence_transformers import SentenceTransformer
 from openai import OpenAI
@@ -22,10 +25,56 @@ class ProductInfo:
     imagenes: List[str]
     activo: bool
 
+def embedding_cache_key(model: str, text: str) -> str:
+    """Clave de contenido para un embedding: hash del modelo y del texto"""
+    return hashlib.blake2b(model.encode() + b"\x00" + text.encode(), digest_size=16).hexdigest()
+
 class EmbeddingGenerator:
-    def __init__(self, model: str = "text-embedding-3-small"):
+    def __init__(self, model: str = "text-embedding-3-small", query_cache_size: int = 1024):
         self.client = OpenAI()
         self.model = model
+        # Cache LRU de embeddings de consultas (frases repetidas como "¿Cuál es el precio?")
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embedding de una consulta, reutilizando el de un texto idéntico si ya se calculó"""
+        return self.embed_queries([text])[0]
+    
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings de varias consultas; las que no están en cache van en una sola llamada"""
+        keys = [embedding_cache_key(self.model, text) for text in texts]
+        with self._query_cache_lock:
+            embeddings = [self._query_cache.get(key) for key in keys]
+            for key, embedding in zip(keys, embeddings):
+                if embedding is not None:
+                    self._query_cache.move_to_end(key)
+        
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+        
+        response = self.client.embeddings.create(
+            input=[texts[i] for i in missing],
+            model=self.model
+        )
+        for item in response.data:
+            embeddings[missing[item.index]] = item.embedding
+        
+        with self._query_cache_lock:
+            for i in missing:
+                self._query_cache[keys[i]] = embeddings[i]
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return embeddings
+    
+    def build_cache(self, embeddings_data: List[Dict]) -> Dict[str, List[float]]:
+        """Indexa embeddings ya generados por clave de contenido"""
+        return {
+            embedding_cache_key(self.model, item['text']): item['embedding']
+            for item in embeddings_data
+        }
     
     def create_product_text(self, product: ProductInfo) -> str:
         """Crea representación de texto comprensiva del producto para embedding"""
@@ -63,46 +112,60 @@ class EmbeddingGenerator:
         
         return " | ".join(text_parts)
     
-    def generate_embeddings(self, products: List[ProductInfo]) -> List[Dict]:
-        """Genera embeddings para todos los productos"""
-        embeddings_data = []
+    def generate_embeddings(self, products: List[ProductInfo],
+                            cache: Optional[Dict[str, List[float]]] = None,
+                            batch_size: int = 256) -> List[Dict]:
+        """
+        Genera embeddings para todos los productos. Si se pasa `cache` (ver build_cache),
+        los productos cuyo texto no cambió reutilizan su embedding sin llamar a la API.
+        Los textos restantes se envían a OpenAI en lotes de `batch_size` y los
+        vectores se guardan en float16 para reducir a la mitad el archivo de embeddings
+        """
+        cache = cache or {}
+        texts = [self.create_product_text(product) for product in products]
+        embeddings = [cache.get(embedding_cache_key(self.model, text)) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
         
-        for product in products:
-            text = self.create_product_text(product)
-            
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
             try:
                 # Usando embeddings de OpenAI
                 response = self.client.embeddings.create(
-                    input=text,
+                    input=[texts[i] for i in batch],
                     model=self.model
                 )
-                embedding = response.data[0].embedding
-                
-                # Alternativa: usando sentence-transformers
-                # embedding = self.sentence_model.encode(text).tolist()
-                
-                embedding_info = {
-                    'product_id': product.id,
-                    'text': text,
-                    'embedding': embedding,
-                    'product_data': {
-                        'id': product.id,
-                        'nombre': product.nombre,
-                        'descripcion': product.descripcion,
-                        'categoria_id': product.categoria_id,
-                        'categoria': product.categoria,
-                        'categoria_descripcion': product.categoria_descripcion,
-                        'precio_actual': product.precio_actual,
-                        'promociones': product.promociones,
-                        'imagenes': product.imagenes
-                    }
-                }
-                embeddings_data.append(embedding_info)
-                
+                for item in response.data:
+                    embeddings[batch[item.index]] = item.embedding
             except Exception as e:
-                print(f"Error generando embedding para producto {product.id}: {e}")
+                print(f"Error generando embeddings para productos {[products[i].id for i in batch]}: {e}")
+                continue
+        
+        # Alternativa: usando sentence-transformers
+        # embeddings = self.sentence_model.encode(texts, batch_size=batch_size)
+        
+        embeddings_data = []
+        for product, text, embedding in zip(products, texts, embeddings):
+            if embedding is None:
                 continue
+            embeddings_data.append({
+                'product_id': product.id,
+                'text': text,
+                'embedding': np.asarray(embedding, dtype=np.float16),
+                'product_data': {
+                    'id': product.id,
+                    'nombre': product.nombre,
+                    'descripcion': product.descripcion,
+                    'categoria_id': product.categoria_id,
+                    'categoria': product.categoria,
+                    'categoria_descripcion': product.categoria_descripcion,
+                    'precio_actual': product.precio_actual,
+                    'promociones': product.promociones,
+                    'imagenes': product.imagenes
+                }
+            })
         
+        if cache:
+            print(f"Embeddings reutilizados desde cache: {len(products) - len(missing)}/{len(products)}")
         return embeddings_data
     
     def save_embeddings(self, embeddings_data: List[Dict], filepath: str):
@@ -111,48 +174,104 @@ class EmbeddingGenerator:
             pickle.dump(embeddings_data, f)
         print(f"Embeddings guardados en {filepath}")
     
+    def append_embeddings(self, embeddings_data: List[Dict], f):
+        """Añade un lote al archivo abierto en f; load_embeddings concatena los lotes"""
+        pickle.dump(embeddings_data, f)
+    
     def load_embeddings(self, filepath: str) -> List[Dict]:
-        """Carga embeddings desde archivo"""
+        """Carga embeddings desde archivo (uno o varios lotes pickle seguidos)"""
+        embeddings_data = []
         with open(filepath, 'rb') as f:
-            embeddings_data = pickle.load(f)
+            while True:
+                try:
+                    embeddings_data.extend(pickle.load(f))
+                except EOFError:
+                    break
         print(f"Embeddings cargados desde {filepath}")
         return embeddings_data
 
 class VectorStore:
     def __init__(self, dimension: int = 1536):  # Dimensión de OpenAI text-embedding-3-small
         self.dimension = dimension
-        self.index = faiss.IndexFlatIP(dimension)  # Producto interno para similitud coseno
-        self.metadata = []
+        # Producto interno para similitud coseno; los vectores se identifican por
+        # product_id para poder actualizarlos o borrarlos sin reconstruir el índice
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        self.metadata = {}
+    
+    def is_id_mapped(self) -> bool:
+        """False para índices guardados antes de identificar vectores por product_id"""
+        return isinstance(self.metadata, dict)
         
     def add_embeddings(self, embeddings_data: List[Dict]):
         """Agrega embeddings al almacén vectorial"""
-        embeddings = np.array([item['embedding'] for item in embeddings_data]).astype('float32')
+        # Los embeddings se almacenan en float16; FAISS trabaja en float32. La matriz
+        # se arma con una sola copia y se normaliza en el sitio
+        embeddings = np.empty((len(embeddings_data), self.dimension), dtype=np.float32)
+        for row, item in zip(embeddings, embeddings_data):
+            row[:] = item['embedding']
+        ids = np.array([item['product_id'] for item in embeddings_data], dtype=np.int64)
         
         # Normalizar para similitud coseno
         faiss.normalize_L2(embeddings)
         
-        self.index.add(embeddings)
-        self.metadata.extend(embeddings_data)
+        self.index.add_with_ids(embeddings, ids)
+        for item in embeddings_data:
+            self.metadata[item['product_id']] = self._metadata_entry(item)
         
         print(f"Agregados {len(embeddings_data)} embeddings al almacén vectorial")
     
+    def upsert_embeddings(self, embeddings_data: List[Dict]) -> int:
+        """
+        Agrega o actualiza embeddings por product_id. Solo se re-indexan los productos
+        nuevos o cuyo texto cambió; al resto se le actualizan los metadatos
+        """
+        changed = [item for item in embeddings_data
+                   if item['product_id'] not in self.metadata
+                   or self.metadata[item['product_id']]['text'] != item['text']]
+        if changed:
+            self.remove_ids([item['product_id'] for item in changed if item['product_id'] in self.metadata])
+            self.add_embeddings(changed)
+        for item in embeddings_data:
+            self.metadata[item['product_id']] = self._metadata_entry(item)
+        return len(changed)
+    
+    @staticmethod
+    def _metadata_entry(item: Dict) -> Dict:
+        """El vector ya vive en el índice FAISS; los metadatos no guardan otra copia"""
+        return {key: value for key, value in item.items() if key != 'embedding'}
+    
+    def remove_ids(self, product_ids: List[int]):
+        """Elimina del índice los vectores de los productos indicados"""
+        if not product_ids:
+            return
+        self.index.remove_ids(np.array(product_ids, dtype=np.int64))
+        for product_id in product_ids:
+            self.metadata.pop(product_id, None)
+        print(f"Eliminados {len(product_ids)} embeddings del almacén vectorial")
+    
     def search(self, query_embedding: List[float], k: int = 5) -> List[Dict]:
         """Busca embeddings similares"""
-        query_vec = np.array([query_embedding]).astype('float32')
-        faiss.normalize_L2(query_vec)
+        return self.search_batch([query_embedding], k)[0]
+    
+    def search_batch(self, query_embeddings: List[List[float]], k: int = 5) -> List[List[Dict]]:
+        """Busca embeddings similares para varias consultas con una sola llamada a FAISS"""
+        query_vecs = np.array(query_embeddings, dtype=np.float32)
+        faiss.normalize_L2(query_vecs)
         
-        scores, indices = self.index.search(query_vec, k)
+        scores, indices = self.index.search(query_vecs, k)
         
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1:  # Índice válido
-                result = {
-                    'score': float(scores[0][i]),
-                    'metadata': self.metadata[idx]
-                }
-                results.append(result)
+        batch_results = []
+        for row_scores, row_indices in zip(scores, indices):
+            results = []
+            for score, idx in zip(row_scores, row_indices):
+                if idx != -1:  # Índice válido
+                    results.append({
+                        'score': float(score),
+                        'metadata': self.metadata[int(idx)]
+                    })
+            batch_results.append(results)
         
-        return results
+        return batch_results
     
     def save_index(self, filepath: str):
         """Guarda el índice vectorial y metadatos"""
@@ -160,9 +279,18 @@ class VectorStore:
         with open(f"{filepath}.metadata", 'wb') as f:
             pickle.dump(self.metadata, f)
     
-    def load_index(self, filepath: str):
-        """Carga el índice vectorial y metadatos"""
-        self.index = faiss.read_index(f"{filepath}.index")
+    def load_index(self, filepath: str, read_only: bool = False):
+        """
+        Carga el índice vectorial y metadatos. Con read_only y una FAISS con
+        IO_FLAG_MMAP_IFC, los vectores de índices planos quedan respaldados por el
+        archivo (mmap) y varios procesos comparten la page cache; el índice no admite
+        add(). Con FAISS más antiguas se carga en memoria como siempre
+        """
+        if read_only and hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+            # IO_FLAG_MMAP no mapea los códigos de IndexFlat/IndexIDMap2: los copia
+            self.index = faiss.read_index(f"{filepath}.index", faiss.IO_FLAG_MMAP_IFC)
+        else:
+            self.index = faiss.read_index(f"{filepath}.index")
         with open(f"{filepath}.metadata", 'rb') as f:
             self.metadata = pickle.load(f)
 
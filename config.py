@@ -12,6 +12,9 @@ class DatabaseConfig:
     user: str
     password: str
     port: int = 5432
+    pool_min: int = 2
+    pool_max: int = 20
+    pool_timeout: float = 30.0  # segundos esperando una conexión libre
     
     def to_dict(self) -> Dict[str, str]:
         return {
@@ -35,6 +38,13 @@ class VectorConfig:
     dimension: int = 1536  # text-embedding-3-small dimension
     top_k_results: int = 3
     similarity_threshold: float = 0.7
+    read_only: bool = False  # mmap del índice FAISS en solo lectura
+
+@dataclass
+class RedisConfig:
+    url: str = "redis://localhost:6379/0"
+    context_ttl: int = 3600  # segundos que se conserva el contexto de un cliente
+    context_max_messages: int = 10
 
 @dataclass
 class ServerConfig:
@@ -60,7 +70,10 @@ class Config:
             database=os.getenv('DB_NAME', 'ecommerce'),
             user=os.getenv('DB_USER', ''),
             password=os.getenv('DB_PASS', ''),
-            port=int(os.getenv('DB_PORT', '5432'))
+            port=int(os.getenv('DB_PORT', '5432')),
+            pool_min=int(os.getenv('DB_POOL_MIN', '2')),
+            pool_max=int(os.getenv('DB_POOL_MAX', '20')),
+            pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', '30'))
         )
         
         self.openai = OpenAIConfig(
@@ -74,7 +87,14 @@ class Config:
         self.vector = VectorConfig(
             dimension=int(os.getenv('VECTOR_DIMENSION', '1536')),
             top_k_results=int(os.getenv('VECTOR_TOP_K', '3')),
-            similarity_threshold=float(os.getenv('VECTOR_SIMILARITY_THRESHOLD', '0.7'))
+            similarity_threshold=float(os.getenv('VECTOR_SIMILARITY_THRESHOLD', '0.7')),
+            read_only=os.getenv('FAISS_READ_ONLY', '0') == '1'
+        )
+        
+        self.redis = RedisConfig(
+            url=os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+            context_ttl=int(os.getenv('REDIS_CONTEXT_TTL', '3600')),
+            context_max_messages=int(os.getenv('REDIS_CONTEXT_MAX_MESSAGES', '10'))
         )
         
         # self.server = ServerConfig(
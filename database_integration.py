@@ -1,7 +1,20 @@
-import psycopg2
+from psycopg2.extras import NamedTupleCursor, RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+import redis
 from datetime import datetime, date, timedelta
-from typing import Dict, List, Optional
-import json
+from typing import Dict, Iterator, List, Optional
+import orjson
+import functools
+import threading
+import time
+import os
+import csv
+import io
+from collections import OrderedDict, defaultdict
+from itertools import groupby
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from config import config
 from chatbot_system import EmbeddingGenerator, VectorStore, ProductInfo;
 from advertisement_generator import AdvertisementGenerator;
@@ -10,117 +23,265 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Pausa entre mensajes en test_conversation_flow (segundos) para demos manuales
+SIMULATE_DELAY = float(os.environ.get("SIMULATE_DELAY", "0"))
+
+# Migraciones idempotentes que aplica el comando `setup`
+SCHEMA_MIGRATIONS = [
+    # Copia de nombre/descripcion de la categoria en producto para que el
+    # catalogo se lea sin JOIN; los triggers mantienen la copia sincronizada
+    """ALTER TABLE producto
+        ADD COLUMN IF NOT EXISTS categoria_nombre TEXT,
+        ADD COLUMN IF NOT EXISTS categoria_descripcion TEXT""",
+    """UPDATE producto p
+        SET categoria_nombre = c.nombre,
+            categoria_descripcion = c.descripcion
+        FROM categoria c
+        WHERE p.categoria_id = c.id
+        AND (p.categoria_nombre IS DISTINCT FROM c.nombre
+             OR p.categoria_descripcion IS DISTINCT FROM c.descripcion)""",
+    """CREATE OR REPLACE FUNCTION sync_producto_categoria() RETURNS trigger AS $$
+        BEGIN
+            UPDATE producto
+            SET categoria_nombre = NEW.nombre,
+                categoria_descripcion = NEW.descripcion
+            WHERE categoria_id = NEW.id;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS trg_categoria_sync_producto ON categoria",
+    """CREATE TRIGGER trg_categoria_sync_producto
+        AFTER UPDATE OF nombre, descripcion ON categoria
+        FOR EACH ROW EXECUTE FUNCTION sync_producto_categoria()""",
+    """CREATE OR REPLACE FUNCTION fill_producto_categoria() RETURNS trigger AS $$
+        BEGIN
+            SELECT c.nombre, c.descripcion
+            INTO NEW.categoria_nombre, NEW.categoria_descripcion
+            FROM categoria c
+            WHERE c.id = NEW.categoria_id;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS trg_producto_fill_categoria ON producto",
+    """CREATE TRIGGER trg_producto_fill_categoria
+        BEFORE INSERT OR UPDATE OF categoria_id ON producto
+        FOR EACH ROW EXECUTE FUNCTION fill_producto_categoria()""",
+    # Catalogo activo con el precio vigente ya resuelto (o el mas reciente si
+    # ninguno esta vigente). CURRENT_DATE se fija al refrescar, por lo que la
+    # vista debe refrescarse al menos una vez al dia (comando refresh_views)
+    """CREATE MATERIALIZED VIEW IF NOT EXISTS producto_activo_actual AS
+        SELECT
+            p.id,
+            p.nombre,
+            p.descripcion,
+            p.activo,
+            p.categoria_id,
+            p.categoria_nombre,
+            p.categoria_descripcion,
+            pr.valor AS precio_actual,
+            pr.lista_precios
+        FROM producto p
+        LEFT JOIN LATERAL (
+            SELECT pr.valor, lp.nombre AS lista_precios
+            FROM precio pr
+            JOIN lista_precios lp ON pr.lista_precios_id = lp.id
+            WHERE pr.producto_id = p.id
+            ORDER BY COALESCE(pr.fecha_inicio <= CURRENT_DATE
+                              AND (pr.fecha_fin IS NULL OR pr.fecha_fin >= CURRENT_DATE), FALSE) DESC,
+                     pr.fecha_inicio DESC
+            LIMIT 1
+        ) pr ON TRUE
+        WHERE p.activo = TRUE""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_producto_activo_actual_id ON producto_activo_actual (id)",
+    # Consultas más frecuentes de los últimos 30 días para ChatAnalytics; se
+    # refresca junto con el catálogo (comando refresh_views). El índice único va
+    # sobre el hash del texto porque un mensaje largo no cabe en una clave btree
+    """CREATE MATERIALIZED VIEW IF NOT EXISTS popular_queries_30d AS
+        SELECT
+            md5(m.contenido_texto) AS query_hash,
+            m.contenido_texto,
+            COUNT(*) AS frequency
+        FROM mensaje m
+        JOIN conversacion c ON m.conversacion_id = c.id
+        WHERE m.isBot = FALSE
+        AND m.contenido_texto IS NOT NULL
+        AND LENGTH(m.contenido_texto) > 5
+        AND c.fecha >= CURRENT_DATE - INTERVAL '30 days'
+        GROUP BY m.contenido_texto""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_popular_queries_30d_hash ON popular_queries_30d (query_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_popular_queries_30d_frequency ON popular_queries_30d (frequency DESC)",
+    # Índices para los rangos de fecha de ChatAnalytics. CONCURRENTLY no bloquea
+    # escrituras en tablas con tráfico del webhook (requiere autocommit, que es el
+    # modo de las conexiones del pool). contenido_texto no se incluye en el
+    # índice de mensaje porque un texto largo excede el tamaño máximo de fila btree
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversacion_fecha_cliente
+        ON conversacion (fecha, cliente_id) INCLUDE (id)""",
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_mensaje_conv_tipo
+        ON mensaje (conversacion_id) INCLUDE (tipo, isBot)""",
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_mensaje_user_queries
+        ON mensaje (conversacion_id)
+        WHERE isBot = FALSE AND contenido_texto IS NOT NULL AND LENGTH(contenido_texto) > 5""",
+]
+
+# Consultas que se ejecutan en cada webhook; se preparan una vez por conexion
+# para que el servidor no vuelva a parsear/planificar en cada llamada
+PREPARED_STATEMENTS = {
+    "find_client_stmt": "SELECT id FROM cliente WHERE telefono = $1",
+    "find_conversation_stmt": """SELECT id FROM conversacion WHERE cliente_id = $1 AND fecha = $2
+        ORDER BY id DESC LIMIT 1""",
+}
+
+class PreparedConnectionPool(ThreadedConnectionPool):
+    """Pool cuyas conexiones nuevas quedan en autocommit y con PREPARED_STATEMENTS listas"""
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for name, statement in PREPARED_STATEMENTS.items():
+                cursor.execute(f"PREPARE {name} AS {statement}")
+        return conn
+
+
+# Marcador de NULL en los buffers de COPY, distinto del texto vacío
+COPY_NULL = '\\N'
+
+
 class DatabaseManager:
     def __init__(self, db_config: Dict[str, str]):
         self.db_config = db_config
-        self.connection = None
+        self._pool = None
+        # getconn() falla al instante con el pool agotado; el semáforo hace que los
+        # hilos esperen turno (hasta pool_timeout) como con una sola conexión
+        self._pool_slots = threading.BoundedSemaphore(db_config.pool_max)
+        # Conexión prestada al hilo actual: los préstamos anidados la reutilizan
+        self._borrowed = threading.local()
 
     def connect(self):
         try:
-            self.connection = psycopg2.connect(
+            self._pool = PreparedConnectionPool(
+                self.db_config.pool_min,
+                self.db_config.pool_max,
                 host=self.db_config.host,
                 database=self.db_config.database,
                 user=self.db_config.user,
                 password=self.db_config.password,
                 port=self.db_config.port
             )
-            self.connection.autocommit = True
-            print("Database connection established")
+            print("Database connection pool established")
         except Exception as e:
             print(f"Error connecting to database: {e}")
             raise
 
     def disconnect(self):
-        if self.connection:
-            self.connection.close()
+        if self._pool:
+            self._pool.closeall()
+            self._pool = None
+
+    @contextmanager
+    def cursor(self, **kwargs):
+        """Presta una conexión del pool durante el bloque y la devuelve al salir"""
+        conn = getattr(self._borrowed, 'conn', None)
+        if conn is not None:
+            # Préstamo anidado (p. ej. _rows_to_products dentro de iter_products_data):
+            # otra conexión podría esperar para siempre a que este mismo hilo libere la suya
+            with conn.cursor(**kwargs) as cursor:
+                yield cursor
+            return
+        
+        if not self._pool_slots.acquire(timeout=self.db_config.pool_timeout):
+            raise PoolError(f"no free connection after {self.db_config.pool_timeout}s")
+        try:
+            conn = self._pool.getconn()
+            self._borrowed.conn = conn
+            try:
+                with conn.cursor(**kwargs) as cursor:
+                    yield cursor
+            finally:
+                self._borrowed.conn = None
+                self._pool.putconn(conn)
+        finally:
+            self._pool_slots.release()
+
+    @contextmanager
+    def tx(self, **kwargs):
+        """Como cursor(), pero el bloque completo corre en una transacción explícita"""
+        with self.cursor(**kwargs) as cursor:
+            cursor.execute("BEGIN")
+            try:
+                yield cursor
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+
+    def apply_migrations(self):
+        with self.cursor() as cursor:
+            for statement in SCHEMA_MIGRATIONS:
+                cursor.execute(statement)
+            print(f"Applied {len(SCHEMA_MIGRATIONS)} schema migrations")
+
+    def refresh_product_view(self):
+        """Recalcula la vista materializada del catalogo activo"""
+        with self.cursor() as cursor:
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY producto_activo_actual")
+
+    def refresh_analytics_views(self):
+        """Recalcula las vistas materializadas de ChatAnalytics"""
+        with self.cursor() as cursor:
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY popular_queries_30d")
 
     # === Producto metodos ===
     def extract_products_data(self) -> List[ProductInfo]:
+        return [product for batch in self.iter_products_data() for product in batch]
+
+    def iter_products_data(self, batch_size: int = 1000) -> Iterator[List[ProductInfo]]:
+        """Recorre el catalogo activo en lotes de batch_size productos"""
         query = """SELECT 
-            p.id,
-            p.nombre,
-            p.descripcion,
-            p.activo,
-            c.id as categoria_id,
-            c.nombre as categoria_nombre,
-            c.descripcion as categoria_descripcion,
-            lp.nombre as lista_precios_nombre,
-            pr.valor as precio_valor,
-            pr.fecha_inicio as precio_fecha_inicio,
-            pr.fecha_fin as precio_fecha_fin
-        FROM producto p
-        LEFT JOIN categoria c ON p.categoria_id = c.id
-        LEFT JOIN precio pr ON p.id = pr.producto_id
-        LEFT JOIN lista_precios lp ON pr.lista_precios_id = lp.id
-        WHERE p.activo = TRUE
-        ORDER BY p.id, pr.fecha_inicio DESC;"""
+            id,
+            nombre,
+            descripcion,
+            activo,
+            categoria_id,
+            categoria_nombre,
+            categoria_descripcion,
+            precio_actual,
+            lista_precios
+        FROM producto_activo_actual
+        ORDER BY id;"""
 
-        cursor = self.connection.cursor()
-        cursor.execute(query)
-        results = cursor.fetchall()
+        # Cursor del lado del servidor: cada lote se trae con fetchmany y se
+        # entrega antes de pedir el siguiente, sin materializar todo el catalogo
+        with self.cursor(name='extract_products', withhold=True) as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield self._rows_to_products(rows)
 
-        products_dict = {}
-        for row in results:
-            product_id = row[0]
-            if product_id not in products_dict:
-                products_dict[product_id] = {
-                    'id': row[0],
-                    'nombre': row[1],
-                    'descripcion': row[2] or "",
-                    'activo': row[3],
-                    'categoria_id': row[4] or 0,
-                    'categoria': row[5] or "",
-                    'categoria_descripcion': row[6] or "",
-                    'precios': [],
-                    'promociones': [],
-                    'imagenes': []
-                }
-            if row[7]:
-                precio_info = {
-                    'lista_precios': row[7],
-                    'valor': float(row[8]) if row[8] else 0,
-                    'fecha_inicio': row[9],
-                    'fecha_fin': row[10]
-                }
-                if precio_info not in products_dict[product_id]['precios']:
-                    products_dict[product_id]['precios'].append(precio_info)
-
-        for product_id in products_dict.keys():
-            products_dict[product_id]['promociones'] = self._get_product_promotions(product_id)
-            products_dict[product_id]['imagenes'] = self._get_product_images(product_id)
-
-        products = []
-        for data in products_dict.values():
-            current_price = 0
-            current_lista = "Sin lista de precios"
-            if data['precios']:
-                current_date = date.today()
-                valid_prices = [p for p in data['precios']
-                                if p['fecha_inicio'] <= current_date and
-                                (p['fecha_fin'] is None or p['fecha_fin'] >= current_date)]
-                selected_price = valid_prices[0] if valid_prices else data['precios'][0]
-                current_price = selected_price['valor']
-                current_lista = selected_price['lista_precios']
-
-            products.append(ProductInfo(
-                id=data['id'],
-                nombre=data['nombre'],
-                descripcion=data['descripcion'],
-                categoria_id=data['categoria_id'],
-                categoria=data['categoria'],
-                categoria_descripcion=data['categoria_descripcion'],
-                precio_actual=current_price,
-                lista_precios=current_lista,
-                promociones=data['promociones'],
-                imagenes=data['imagenes'],
-                activo=data['activo']
-            ))
-
-        cursor.close()
-        return products
+    def _rows_to_products(self, rows: List[tuple]) -> List[ProductInfo]:
+        product_ids = [row[0] for row in rows]
+        promotions = self._get_products_promotions(product_ids)
+        images = self._get_products_images(product_ids)
+
+        return [ProductInfo(
+            id=row[0],
+            nombre=row[1],
+            descripcion=row[2] or "",
+            categoria_id=row[4] or 0,
+            categoria=row[5] or "",
+            categoria_descripcion=row[6] or "",
+            precio_actual=float(row[7]) if row[7] else 0,
+            lista_precios=row[8] or "Sin lista de precios",
+            promociones=promotions.get(row[0], []),
+            imagenes=images.get(row[0], []),
+            activo=row[3]
+        ) for row in rows]
 
-    def _get_product_promotions(self, product_id: int) -> List[Dict]:
+    def _get_products_promotions(self, product_ids: List[int]) -> Dict[int, List[Dict]]:
         query = """ SELECT 
+                pp.producto_id,
                 pr.id,
                 pr.nombre,
                 pr.descripcion,
@@ -129,239 +290,290 @@ class DatabaseManager:
                 pp.descuento_porcentaje
             FROM promocion pr
             JOIN promo_producto pp ON pr.id = pp.promocion_id
-            WHERE pp.producto_id = %s
+            WHERE pp.producto_id = ANY(%s)
             AND pr.fecha_inicio <= CURRENT_DATE
             AND (pr.fecha_fin IS NULL OR pr.fecha_fin >= CURRENT_DATE);"""
-        cursor = self.connection.cursor()
-        cursor.execute(query, (product_id,))
-        results = cursor.fetchall()
-        cursor.close()
-        return [{
-            'id': row[0],
-            'nombre': row[1],
-            'descripcion': row[2] or "",
-            'fecha_inicio': row[3],
-            'fecha_fin': row[4],
-            'descuento_porcentaje': float(row[5]) if row[5] else 0
-        } for row in results]
-
-    def _get_product_images(self, product_id: int) -> List[str]:
-        query = """SELECT url, descripcion
+        with self.cursor() as cursor:
+            cursor.execute(query, (product_ids,))
+            results = cursor.fetchall()
+        promotions = {}
+        for row in results:
+            promotions.setdefault(row[0], []).append({
+                'id': row[1],
+                'nombre': row[2],
+                'descripcion': row[3] or "",
+                'fecha_inicio': row[4],
+                'fecha_fin': row[5],
+                'descuento_porcentaje': float(row[6]) if row[6] else 0
+            })
+        return promotions
+
+    def _get_products_images(self, product_ids: List[int]) -> Dict[int, List[Dict]]:
+        query = """SELECT producto_id, url, descripcion
         FROM imagen
-        WHERE producto_id = %s;""" 
-        cursor = self.connection.cursor()
-        cursor.execute(query, (product_id,))
-        results = cursor.fetchall()
-        cursor.close()
-        return [{"url": row[0], "descripcion": row[1] or ""} for row in results]
+        WHERE producto_id = ANY(%s);""" 
+        with self.cursor() as cursor:
+            cursor.execute(query, (product_ids,))
+            results = cursor.fetchall()
+        images = {}
+        for row in results:
+            images.setdefault(row[0], []).append({"url": row[1], "descripcion": row[2] or ""})
+        return images
 
     # === Chat metodos ===
     def get_or_create_client(self, telefono: str, nombre: str = None, correo: str = None) -> int:
-        cursor = self.connection.cursor()
-        cursor.execute("SELECT id FROM cliente WHERE telefono = %s", (telefono,))
+        with self.cursor() as cursor:
+            return self._get_or_create_client(cursor, telefono, nombre, correo)
+
+    def get_or_create_conversation(self, client_id: int, descripcion: str = None) -> int:
+        with self.cursor() as cursor:
+            return self._get_or_create_conversation(cursor, client_id, descripcion)
+
+    def get_or_create_client_conversation(self, telefono: str, nombre: str = None) -> tuple:
+        """Resuelve cliente y conversación del día en una sola transacción"""
+        with self.tx() as cursor:
+            client_id = self._get_or_create_client(cursor, telefono, nombre)
+            conversation_id = self._get_or_create_conversation(cursor, client_id)
+        return client_id, conversation_id
+
+    def _get_or_create_client(self, cursor, telefono: str, nombre: str = None, correo: str = None) -> int:
+        cursor.execute("EXECUTE find_client_stmt(%s)", (telefono,))
         result = cursor.fetchone()
         if result:
-            client_id = result[0]
-        else:
-            nombre = nombre or f"Cliente_{telefono}"
-            cursor.execute(
-                "INSERT INTO cliente (telefono, nombre, correo) VALUES (%s, %s, %s) RETURNING id",
-                (telefono, nombre, correo)
-            )
-            client_id = cursor.fetchone()[0]
-            print(f"Created new client with ID: {client_id}")
-        cursor.close()
+            return result[0]
+        nombre = nombre or f"Cliente_{telefono}"
+        cursor.execute(
+            "INSERT INTO cliente (telefono, nombre, correo) VALUES (%s, %s, %s) RETURNING id",
+            (telefono, nombre, correo)
+        )
+        client_id = cursor.fetchone()[0]
+        print(f"Created new client with ID: {client_id}")
         return client_id
 
-    def get_or_create_conversation(self, client_id: int, descripcion: str = None) -> int:
-        cursor = self.connection.cursor()
+    def _get_or_create_conversation(self, cursor, client_id: int, descripcion: str = None) -> int:
         today = date.today()
-        cursor.execute("""
-            SELECT id FROM conversacion WHERE cliente_id = %s AND fecha = %s 
-            ORDER BY id DESC LIMIT 1
-        """, (client_id, today))
+        cursor.execute("EXECUTE find_conversation_stmt(%s, %s)", (client_id, today))
         result = cursor.fetchone()
         if result:
-            conversation_id = result[0]
-        else:
-            descripcion = descripcion or f"Conversación del {today}"
-            cursor.execute("""
-                INSERT INTO conversacion (fecha, descripcion, cliente_id)
-                VALUES (%s, %s, %s) RETURNING id
-            """, (today, descripcion, client_id))
-            conversation_id = cursor.fetchone()[0]
-            print(f"Created new conversation with ID: {conversation_id}")
-        cursor.close()
+            return result[0]
+        descripcion = descripcion or f"Conversación del {today}"
+        cursor.execute("""
+            INSERT INTO conversacion (fecha, descripcion, cliente_id)
+            VALUES (%s, %s, %s) RETURNING id
+        """, (today, descripcion, client_id))
+        conversation_id = cursor.fetchone()[0]
+        print(f"Created new conversation with ID: {conversation_id}")
         return conversation_id
 
     def save_message(self, conversation_id: int, tipo: str, contenido_texto: str,
                      is_bot: bool, media_url: str = None, media_mimetype: str = None,
                      media_filename: str = None):
-        cursor = self.connection.cursor()
-        cursor.execute("""
-            INSERT INTO mensaje (tipo, contenido_texto, media_url, media_mimetype,
-                                 media_filename, fecha, isBot, conversacion_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (tipo, contenido_texto, media_url, media_mimetype, media_filename,
-              datetime.now(), is_bot, conversation_id))
-        cursor.close()
-        logger.info(f"Message saved: {tipo}, is_bot: {is_bot}, conversation_id: {conversation_id}")
+        self.save_messages([(tipo, contenido_texto, media_url, media_mimetype, media_filename,
+                             datetime.now(), is_bot, conversation_id)])
+
+    def save_messages(self, rows: List[tuple]):
+        """
+        Inserta varios mensajes en un solo round-trip. Cada fila es
+        (tipo, contenido_texto, media_url, media_mimetype, media_filename, fecha, is_bot, conversation_id)
+        """
+        with self.cursor() as cursor:
+            execute_values(cursor, """
+                INSERT INTO mensaje (tipo, contenido_texto, media_url, media_mimetype,
+                                     media_filename, fecha, isBot, conversacion_id)
+                VALUES %s
+            """, rows)
+        logger.info(f"Messages saved: {len(rows)}")
 
     def get_all_clients(self) -> List[Dict]:
-        cursor = self.connection.cursor()
-        cursor.execute("""
-            SELECT c.*, COUNT(m.id) as conversation_count 
-            FROM cliente c
-            LEFT JOIN conversacion m ON c.id = m.cliente_id
-            GROUP BY c.id
-            ORDER BY c.fecha_creacion DESC
-        """)
-        results = cursor.fetchall()
-        cursor.close()
-        clients = []
-        for row in results:
-            clients.append({
-                "id": row['id'],
-                "phone": row['telefono'],
-                "name": row['nombre'],
-                "email": row['correo'],
-                "created_at": row['fecha_creacion'].isoformat() if row['fecha_creacion'] else None,
-                "conversation_count": row['conversation_count']
-            })
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("""
+                SELECT
+                    c.id,
+                    c.telefono as phone,
+                    c.nombre as name,
+                    c.correo as email,
+                    c.fecha_creacion as created_at,
+                    COUNT(m.id) as conversation_count 
+                FROM cliente c
+                LEFT JOIN conversacion m ON c.id = m.cliente_id
+                GROUP BY c.id
+                ORDER BY c.fecha_creacion DESC
+            """)
+            clients = cursor.fetchall()
+        for client in clients:
+            if client['created_at']:
+                client['created_at'] = client['created_at'].isoformat()
 
         return clients
 
     def get_conversation_history(self, conversation_id: int, limit: int = 20) -> List[Dict]:
-        cursor = self.connection.cursor()
-        cursor.execute("""
-            SELECT tipo, contenido_texto, fecha, isBot, media_url
-            FROM mensaje 
-            WHERE conversacion_id = %s 
-            ORDER BY fecha DESC 
-            LIMIT %s
-        """, (conversation_id, limit))
-        results = cursor.fetchall()
-        cursor.close()
-        return [{
-            'tipo': row[0],
-            'contenido_texto': row[1],
-            'fecha': row[2],
-            'is_bot': row[3],
-            'media_url': row[4]
-        } for row in reversed(results)]
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("""
+                SELECT tipo, contenido_texto, fecha, isBot as is_bot, media_url
+                FROM mensaje 
+                WHERE conversacion_id = %s 
+                ORDER BY fecha DESC 
+                LIMIT %s
+            """, (conversation_id, limit))
+            results = cursor.fetchall()
+        results.reverse()
+        return results
 
     def get_client_conversations(self, client_id: int) -> List[Dict]:
-        cursor = self.connection.cursor()
-        cursor.execute(
-        """
-            SELECT c.id, c.fecha, c.descripcion, COUNT(m.id) as message_count
-            FROM conversacion c
-            LEFT JOIN mensaje m ON c.id = m.conversacion_id
-            WHERE c.cliente_id = %s
-            GROUP BY c.id, c.fecha, c.descripcion
-            ORDER BY c.fecha DESC
-        """, (client_id,))
-        results = cursor.fetchall()
-        cursor.close()
-        return [{
-            'id': row[0],
-            'fecha': row[1],
-            'descripcion': row[2],
-            'message_count': row[3]
-        } for row in results]
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+            """
+                SELECT c.id, c.fecha, c.descripcion, COUNT(m.id) as message_count
+                FROM conversacion c
+                LEFT JOIN mensaje m ON c.id = m.conversacion_id
+                WHERE c.cliente_id = %s
+                GROUP BY c.id, c.fecha, c.descripcion
+                ORDER BY c.fecha DESC
+            """, (client_id,))
+            results = cursor.fetchall()
+        return results
+    
+    def get_conversations_with_messages(self, client_id: int, last_n: int = 5) -> List[Dict]:
+        """Conversaciones del cliente con sus últimos `last_n` mensajes, en una sola consulta"""
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("""
+                SELECT
+                    c.id,
+                    c.fecha,
+                    c.descripcion,
+                    (SELECT COUNT(*) FROM mensaje WHERE conversacion_id = c.id) as message_count,
+                    m.id as mensaje_id,
+                    m.tipo,
+                    m.contenido_texto,
+                    m.fecha as mensaje_fecha,
+                    m.isBot as is_bot
+                FROM conversacion c
+                LEFT JOIN LATERAL (
+                    SELECT id, tipo, contenido_texto, fecha, isBot
+                    FROM mensaje
+                    WHERE conversacion_id = c.id
+                    ORDER BY fecha DESC
+                    LIMIT %s
+                ) m ON TRUE
+                WHERE c.cliente_id = %s
+                ORDER BY c.fecha DESC, c.id, m.fecha
+            """, (last_n, client_id))
+            rows = cursor.fetchall()
+        
+        conversations = []
+        for conversation_id, conversation_rows in groupby(rows, key=itemgetter('id')):
+            conversation_rows = list(conversation_rows)
+            first = conversation_rows[0]
+            conversations.append({
+                'id': conversation_id,
+                'fecha': first['fecha'],
+                'descripcion': first['descripcion'],
+                'message_count': first['message_count'],
+                'messages': [{
+                    'tipo': row['tipo'],
+                    'contenido_texto': row['contenido_texto'],
+                    'fecha': row['mensaje_fecha'],
+                    'is_bot': row['is_bot']
+                } for row in conversation_rows if row['mensaje_id'] is not None]
+            })
+        return conversations
     
     def get_messages_for_analize(self, cliente_id) -> List[Dict]:
-        cursor = self.connection.cursor()
-        cursor.execute("""
-            SELECT m.conversacion_id, m.id as mensaje_id, m.contenido_texto, m.isbot
-            FROM mensaje m
-            JOIN conversacion c ON m.conversacion_id = c.id
-            WHERE c.cliente_id = %s
-            AND m.contenido_texto IS NOT NULL
-            AND NOT EXISTS (
-                SELECT 1 FROM interes i WHERE i.conversacion_id = c.id
-            )
-        """, (cliente_id,))
-        messages = cursor.fetchall()
-        cursor.close()
+        with self.cursor() as cursor:
+            cursor.execute("""
+                SELECT m.conversacion_id, m.id as mensaje_id, m.contenido_texto, m.isbot
+                FROM mensaje m
+                JOIN conversacion c ON m.conversacion_id = c.id
+                WHERE c.cliente_id = %s
+                AND m.contenido_texto IS NOT NULL
+                AND NOT EXISTS (
+                    SELECT 1 FROM interes i WHERE i.conversacion_id = c.id
+                )
+            """, (cliente_id,))
+            messages = cursor.fetchall()
         if not messages:
             return []
         
         return messages
     
     def save_conversation_intents(self, intents):
-        cursor = self.connection.cursor()
+        """
+        Guarda los intereses detectados en bloque: se cargan con COPY en una tabla
+        temporal y luego se actualizan los que el cliente ya tenía e insertan el resto
+        """
+        buffer = io.StringIO()
+        # None se escribe como el marcador \N que el COPY declara como NULL; así un
+        # texto vacío sigue guardándose como '' y no como NULL
+        writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL)
+        for intent in intents:
+            writer.writerow(tuple(COPY_NULL if value is None else value for value in (
+                intent['conversacion_id'],
+                intent['tipo_interes'],
+                intent['entidad_id'],
+                intent.get('entidad_nombre', ''),
+                intent['nivel_interes'],
+                intent.get('contexto', '')
+            )))
+        buffer.seek(0)
+
         try:
-            for intent in intents:
-                # First check if this exact interest already exists for this client
+            with self.tx() as cursor:
                 cursor.execute("""
-                    SELECT COUNT(*) FROM interes i
-                    JOIN conversacion c ON i.conversacion_id = c.id
-                    WHERE c.cliente_id = (
-                        SELECT cliente_id FROM conversacion WHERE id = %s
-                    )
-                    AND i.tipo_interes = %s 
-                    AND i.entidad_id = %s
-                """, (
-                    intent['conversacion_id'],
-                    intent['tipo_interes'],
-                    intent['entidad_id']
-                ))
-            
-                existing_count = cursor.fetchone()[0]
-            
-                if existing_count == 0:
-                    # Only insert if this interest doesn't exist for this client
-                    cursor.execute("""
-                        INSERT INTO interes (conversacion_id, tipo_interes, entidad_id, entidad_nombre, nivel_interes, contexto, fecha_creacion)
-                        VALUES (%s, %s, %s, %s, %s, %s, NOW())
-                        RETURNING id
-                    """, (
-                        intent['conversacion_id'],
-                        intent['tipo_interes'], 
-                        intent['entidad_id'],
-                        intent.get('entidad_nombre', ''),
-                        intent['nivel_interes'],
-                        intent.get('contexto', '')
-                    ))
-                    result = cursor.fetchone()
-                    if result:
-                        logger.info(f"Interés almacenado con ID: {result[0]}")
-                else:
-                    # Optionally update the existing interest with higher confidence level
-                    cursor.execute("""
-                        UPDATE interes SET 
-                            nivel_interes = GREATEST(nivel_interes, %s),
+                    CREATE TEMP TABLE interes_staging (
+                        conversacion_id INTEGER,
+                        tipo_interes TEXT,
+                        entidad_id INTEGER,
+                        entidad_nombre TEXT,
+                        nivel_interes NUMERIC,
+                        contexto TEXT
+                    ) ON COMMIT DROP
+                """)
+                cursor.copy_expert("""
+                    COPY interes_staging (conversacion_id, tipo_interes, entidad_id,
+                                          entidad_nombre, nivel_interes, contexto)
+                    FROM STDIN WITH (FORMAT csv, NULL '\\N')
+                """, buffer)
+
+                # Un interés por cliente/tipo/entidad (el de mayor nivel); si el cliente ya
+                # lo tenía se actualiza con el nivel más alto, si no se inserta
+                cursor.execute("""
+                    WITH staged AS (
+                        SELECT DISTINCT ON (c.cliente_id, s.tipo_interes, s.entidad_id)
+                            c.cliente_id, s.*
+                        FROM interes_staging s
+                        JOIN conversacion c ON c.id = s.conversacion_id
+                        ORDER BY c.cliente_id, s.tipo_interes, s.entidad_id, s.nivel_interes DESC
+                    ),
+                    updated AS (
+                        UPDATE interes i SET 
+                            nivel_interes = GREATEST(i.nivel_interes, s.nivel_interes),
                             contexto = CASE 
-                                WHEN %s > nivel_interes THEN %s 
-                                ELSE contexto 
+                                WHEN s.nivel_interes > i.nivel_interes THEN s.contexto 
+                                ELSE i.contexto 
                             END,
                             fecha_creacion = NOW()
-                        WHERE id IN (
-                            SELECT i.id FROM interes i
-                            JOIN conversacion c ON i.conversacion_id = c.id
-                            WHERE c.cliente_id = (
-                                SELECT cliente_id FROM conversacion WHERE id = %s
-                            )
-                            AND i.tipo_interes = %s 
-                            AND i.entidad_id = %s
-                            LIMIT 1
-                        )
-                    """, (
-                        intent['nivel_interes'],
-                        intent['nivel_interes'],
-                        intent.get('contexto', ''),
-                        intent['conversacion_id'],
-                        intent['tipo_interes'],
-                        intent['entidad_id']
-                    ))
-                    logger.info(f"Interés actualizado para cliente - tipo: {intent['tipo_interes']}, entidad: {intent['entidad_id']}")
+                        FROM staged s, conversacion c
+                        WHERE i.conversacion_id = c.id
+                        AND c.cliente_id = s.cliente_id
+                        AND i.tipo_interes = s.tipo_interes 
+                        AND i.entidad_id = s.entidad_id
+                        RETURNING s.cliente_id, s.tipo_interes, s.entidad_id
+                    )
+                    INSERT INTO interes (conversacion_id, tipo_interes, entidad_id, entidad_nombre, nivel_interes, contexto, fecha_creacion)
+                    SELECT s.conversacion_id, s.tipo_interes, s.entidad_id, s.entidad_nombre, s.nivel_interes, s.contexto, NOW()
+                    FROM staged s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM updated u
+                        WHERE u.cliente_id = s.cliente_id
+                        AND u.tipo_interes = s.tipo_interes
+                        AND u.entidad_id = s.entidad_id
+                    )
+                """)
+                logger.info(f"Intereses cargados: {len(intents)}, nuevos: {cursor.rowcount}")
         
-            cursor.close()
             return True
         except Exception as e:
             logger.error(f"Error en save_conversation_intents: {e}")
-            cursor.close()
             return False
     
     def get_clients_with_interests(self, min_interest_level: float = 0.5, 
@@ -369,36 +581,41 @@ class DatabaseManager:
         """
         Get clients with their top interests from the last N days
         """
-        cursor = self.connection.cursor()
-        query = """
-        SELECT DISTINCT
-            c.id as cliente_id,
-            c.telefono,
-            c.nombre,
-            c.correo,
-            i.id,
-            i.tipo_interes,
-            i.entidad_id,
-            i.entidad_nombre,
-            i.nivel_interes,
-            i.contexto,
-            ROW_NUMBER() OVER (PARTITION BY c.id ORDER BY i.nivel_interes DESC) as rn
-        FROM cliente c
-        JOIN conversacion conv ON c.id = conv.cliente_id
-        JOIN interes i ON conv.id = i.conversacion_id
-        WHERE i.nivel_interes >= %s
-        AND i.fecha_creacion >= %s
-        AND i.procesado = FALSE
-        ORDER BY c.id, i.nivel_interes DESC
-        """
+        with self.cursor() as cursor:
+            # El top 3 por cliente se resuelve en el servidor con rn
+            query = """
+            SELECT cliente_id, telefono, nombre, correo, id, tipo_interes,
+                   entidad_id, entidad_nombre, nivel_interes, contexto
+            FROM (
+                SELECT
+                    c.id as cliente_id,
+                    c.telefono,
+                    c.nombre,
+                    c.correo,
+                    i.id,
+                    i.tipo_interes,
+                    i.entidad_id,
+                    i.entidad_nombre,
+                    i.nivel_interes,
+                    i.contexto,
+                    ROW_NUMBER() OVER (PARTITION BY c.id ORDER BY i.nivel_interes DESC) as rn
+                FROM cliente c
+                JOIN conversacion conv ON c.id = conv.cliente_id
+                JOIN interes i ON conv.id = i.conversacion_id
+                WHERE i.nivel_interes >= %s
+                AND i.fecha_creacion >= %s
+                AND i.procesado = FALSE
+            ) t
+            WHERE rn <= 3
+            ORDER BY cliente_id, rn
+            """
         
-        cutoff_date = datetime.now() - timedelta(days=days_back)
+            cutoff_date = datetime.now() - timedelta(days=days_back)
         
-        cursor.execute(query, (min_interest_level, cutoff_date))
-        results = cursor.fetchall()
-        cursor.close()
-        logger.info(f"clientes result: {results}")
-        # Group by client and get top 3 interests per client
+            cursor.execute(query, (min_interest_level, cutoff_date))
+            results = cursor.fetchall()
+        logger.info("clientes result: %s", results)
+        # Group by client; rows are already limited to the top 3 interests per client
         clients_dict = {}
         for row in results:
             client_id = row[0]
@@ -411,107 +628,100 @@ class DatabaseManager:
                     'interests': []
                 }
             
-            # Add interest if we have less than 3 for this client
-            if len(clients_dict[client_id]['interests']) < 3:
-                clients_dict[client_id]['interests'].append({
-                    'id': row[4],
-                    'tipo_interes': row[5],
-                    'entidad_id': row[6],
-                    'entidad_nombre': row[7],
-                    'nivel_interes': float(row[8]),
-                    'contexto': row[9]
-                })
+            clients_dict[client_id]['interests'].append({
+                'id': row[4],
+                'tipo_interes': row[5],
+                'entidad_id': row[6],
+                'entidad_nombre': row[7],
+                'nivel_interes': float(row[8]),
+                'contexto': row[9]
+            })
         
         return list(clients_dict.values())
     
     def get_products_by_category(self, category_name, limit: int = 6) -> List[Dict]:
-        cursor = self.connection.cursor()
-        cursor.execute("""
-        SELECT DISTINCT ON (p.id)
-            p.id,
-            p.nombre,
-            p.descripcion,
-            p.categoria_id,
-            p.activo,
-            c.nombre as categoria,
-            c.descripcion as categoria_descripcion,
-            -- Current price subquery
-            (SELECT pr.valor 
-             FROM precio pr 
-             WHERE pr.producto_id = p.id 
-             AND pr.fecha_inicio <= CURRENT_DATE 
-             AND (pr.fecha_fin IS NULL OR pr.fecha_fin >= CURRENT_DATE)
-             ORDER BY pr.fecha_inicio DESC 
-             LIMIT 1) as precio_actual,
-            -- Current price list
-            (SELECT lp.nombre 
-             FROM precio pr 
-             JOIN lista_precios lp ON pr.lista_precios_id = lp.id
-             WHERE pr.producto_id = p.id 
-             AND pr.fecha_inicio <= CURRENT_DATE 
-             AND (pr.fecha_fin IS NULL OR pr.fecha_fin >= CURRENT_DATE)
-             ORDER BY pr.fecha_inicio DESC 
-             LIMIT 1) as lista_precios,
-            -- Active promotions as JSON array
-            (SELECT COALESCE(JSON_AGG(
-                JSON_BUILD_OBJECT(
-                    'id', prom.id,
-                    'nombre', prom.nombre,
-                    'descripcion', prom.descripcion,
-                    'descuento_porcentaje', pp.descuento_porcentaje,
-                    'fecha_inicio', prom.fecha_inicio,
-                    'fecha_fin', prom.fecha_fin
-                )
-            ), '[]'::json)
-            FROM promocion prom
-            JOIN promo_producto pp ON prom.id = pp.promocion_id
-            WHERE pp.producto_id = p.id
-            AND prom.fecha_inicio <= CURRENT_DATE
-            AND prom.fecha_fin >= CURRENT_DATE) as promociones,
-            -- Images as JSON array
-            (SELECT COALESCE(JSON_AGG(
-                JSON_BUILD_OBJECT(
-                    'id', img.id,
-                    'url', img.url,
-                    'descripcion', img.descripcion
-                )
-            ), '[]'::json)
-            FROM imagen img
-            WHERE img.producto_id = p.id) as imagenes
-        FROM producto p
-        INNER JOIN categoria c ON p.categoria_id = c.id
-        WHERE LOWER(c.nombre) LIKE LOWER(%s)
-        AND p.activo = TRUE
-        ORDER BY p.id, p.nombre
-        LIMIT %s
-        """, (f'%{category_name}%', limit))
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("""
+            SELECT DISTINCT ON (p.id)
+                p.id,
+                p.nombre,
+                p.descripcion,
+                p.categoria_id,
+                p.activo,
+                c.nombre as categoria,
+                c.descripcion as categoria_descripcion,
+                -- Current price subquery
+                (SELECT pr.valor 
+                 FROM precio pr 
+                 WHERE pr.producto_id = p.id 
+                 AND pr.fecha_inicio <= CURRENT_DATE 
+                 AND (pr.fecha_fin IS NULL OR pr.fecha_fin >= CURRENT_DATE)
+                 ORDER BY pr.fecha_inicio DESC 
+                 LIMIT 1) as precio_actual,
+                -- Current price list
+                (SELECT lp.nombre 
+                 FROM precio pr 
+                 JOIN lista_precios lp ON pr.lista_precios_id = lp.id
+                 WHERE pr.producto_id = p.id 
+                 AND pr.fecha_inicio <= CURRENT_DATE 
+                 AND (pr.fecha_fin IS NULL OR pr.fecha_fin >= CURRENT_DATE)
+                 ORDER BY pr.fecha_inicio DESC 
+                 LIMIT 1) as lista_precios,
+                -- Active promotions as JSON array
+                (SELECT COALESCE(JSON_AGG(
+                    JSON_BUILD_OBJECT(
+                        'id', prom.id,
+                        'nombre', prom.nombre,
+                        'descripcion', prom.descripcion,
+                        'descuento_porcentaje', pp.descuento_porcentaje,
+                        'fecha_inicio', prom.fecha_inicio,
+                        'fecha_fin', prom.fecha_fin
+                    )
+                ), '[]'::json)
+                FROM promocion prom
+                JOIN promo_producto pp ON prom.id = pp.promocion_id
+                WHERE pp.producto_id = p.id
+                AND prom.fecha_inicio <= CURRENT_DATE
+                AND prom.fecha_fin >= CURRENT_DATE) as promociones,
+                -- Images as JSON array
+                (SELECT COALESCE(JSON_AGG(
+                    JSON_BUILD_OBJECT(
+                        'id', img.id,
+                        'url', img.url,
+                        'descripcion', img.descripcion
+                    )
+                ), '[]'::json)
+                FROM imagen img
+                WHERE img.producto_id = p.id) as imagenes
+            FROM producto p
+            INNER JOIN categoria c ON p.categoria_id = c.id
+            WHERE LOWER(c.nombre) LIKE LOWER(%s)
+            AND p.activo = TRUE
+            ORDER BY p.id, p.nombre
+            LIMIT %s
+            """, (f'%{category_name}%', limit))
 
-        products = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-        cursor.close()
+            products = cursor.fetchall()
 
-        logger.info(f"Found {len(products)} products in category '{category_name}'")
+        logger.info("Found %s products in category '%s'", len(products), category_name)
 
-        # 🔁 Convertir a lista de diccionarios
-        return [dict(zip(column_names, row)) for row in products]
+        return products
     
     def intereses_procesados(self, interes_ids: List[int]):
-        cursor = self.connection.cursor()
         try:
             placeholders = ','.join(['%s'] * len(interes_ids))
-            cursor.execute(f"""
-                UPDATE interes
-                SET procesado = TRUE
-                WHERE id IN ({placeholders})
-            """, interes_ids)
-            affected_rows = cursor.rowcount
-            logger.info(f"Se han puesto en procesado {affected_rows} intereses: {interes_ids}")
+            with self.cursor() as cursor:
+                cursor.execute(f"""
+                    UPDATE interes
+                    SET procesado = TRUE
+                    WHERE id IN ({placeholders})
+                """, interes_ids)
+                affected_rows = cursor.rowcount
+            logger.info("Se han puesto en procesado %s intereses: %s", affected_rows, interes_ids)
             return affected_rows
         except Exception as e:
             logger.error(f"Error updating interests: {e}")
             raise
-        finally:
-            cursor.close()
             
     def get_product_data(self, product_name: str) -> Optional[ProductInfo]:
         query = """SELECT 
@@ -533,13 +743,73 @@ class DatabaseManager:
         WHERE p.nombre LIKE %s
         ORDER BY p.id, pr.fecha_inicio DESC;"""
 
-        cursor = self.connection.cursor()
-        cursor.execute(query, (f'%{product_name}%',))
-        results = cursor.fetchall()
+        with self.cursor() as cursor:
+            cursor.execute(query, (f'%{product_name}%',))
+            results = cursor.fetchall()
 
         if len(results) == 0:
             return None
 
+        product_id = results[0][0]
+        return self._product_info_from_rows(
+            results,
+            self._get_products_promotions([product_id]).get(product_id, []),
+            self._get_products_images([product_id]).get(product_id, [])
+        )
+
+    def get_products_data(self, product_names: List[str]) -> Dict[str, Optional[ProductInfo]]:
+        """
+        Versión por lotes de get_product_data: una sola consulta para todos los nombres.
+        Cada nombre se resuelve al producto de menor id cuyo nombre lo contiene, como
+        con LIKE '%nombre%' (distingue mayúsculas; un % o _ dentro del nombre se
+        compara como texto literal). A diferencia de get_product_data, los precios
+        salen solo de las filas de ese producto y no de todos los que casan con el
+        LIKE: es intencionado, get_product_data mezcla precios de otros productos
+        """
+        names = list(dict.fromkeys(name for name in product_names if name))
+        if not names:
+            return {}
+
+        query = """SELECT 
+            p.id,
+            p.nombre,
+            p.descripcion,
+            p.activo,
+            c.id as categoria_id,
+            c.nombre as categoria_nombre,
+            c.descripcion as categoria_descripcion,
+            lp.nombre as lista_precios_nombre,
+            pr.valor as precio_valor,
+            pr.fecha_inicio as precio_fecha_inicio,
+            pr.fecha_fin as precio_fecha_fin
+        FROM producto p
+        LEFT JOIN categoria c ON p.categoria_id = c.id
+        LEFT JOIN precio pr ON p.id = pr.producto_id
+        LEFT JOIN lista_precios lp ON pr.lista_precios_id = lp.id
+        WHERE p.nombre LIKE ANY(%s)
+        ORDER BY p.id, pr.fecha_inicio DESC;"""
+
+        with self.cursor() as cursor:
+            cursor.execute(query, ([f'%{name}%' for name in names],))
+            results = cursor.fetchall()
+
+        rows_by_id = OrderedDict((pid, list(rows)) for pid, rows in groupby(results, key=itemgetter(0)))
+        chosen = {
+            name: next((pid for pid, rows in rows_by_id.items() if name in rows[0][1]), None)
+            for name in names
+        }
+
+        product_ids = list({pid for pid in chosen.values() if pid is not None})
+        promociones = self._get_products_promotions(product_ids) if product_ids else {}
+        imagenes = self._get_products_images(product_ids) if product_ids else {}
+
+        return {
+            name: self._product_info_from_rows(rows_by_id[pid], promociones.get(pid, []), imagenes.get(pid, []))
+            if pid is not None else None
+            for name, pid in chosen.items()
+        }
+
+    def _product_info_from_rows(self, results, promociones: List[Dict], imagenes: List[Dict]) -> ProductInfo:
         products_dict = {
             'id': None,
             'nombre': '',
@@ -553,6 +823,7 @@ class DatabaseManager:
             'imagenes': []
         }
 
+        seen_prices = set()
         for row in results:
             if products_dict['id'] is None:
                 products_dict.update({
@@ -565,19 +836,19 @@ class DatabaseManager:
                     'categoria_descripcion': row[6] or ""
                 })
             if row[7]:
-                precio_info = {
-                    'lista_precios': row[7],
-                    'valor': float(row[8]) if row[8] else 0,
-                    'fecha_inicio': row[9],
-                    'fecha_fin': row[10]
-                }
-                if precio_info not in products_dict['precios']:
-                    products_dict['precios'].append(precio_info)
+                valor = float(row[8]) if row[8] else 0
+                price_key = (row[7], valor, row[9], row[10])
+                if price_key not in seen_prices:
+                    seen_prices.add(price_key)
+                    products_dict['precios'].append({
+                        'lista_precios': row[7],
+                        'valor': valor,
+                        'fecha_inicio': row[9],
+                        'fecha_fin': row[10]
+                    })
 
-        product_id = products_dict['id']
-
-        products_dict['promociones'] = self._get_product_promotions(product_id)
-        products_dict['imagenes'] = self._get_product_images(product_id)
+        products_dict['promociones'] = promociones
+        products_dict['imagenes'] = imagenes
 
         current_price = 0
         current_lista = "Sin lista de precios"
@@ -604,7 +875,6 @@ class DatabaseManager:
             activo=products_dict['activo']
         )
 
-        cursor.close()
         return product
 
     def get_promotion_data(self, promo_id: int) -> Optional[Dict]:
@@ -621,17 +891,42 @@ class DatabaseManager:
             AND pr.fecha_inicio <= CURRENT_DATE
             AND (pr.fecha_fin IS NULL OR pr.fecha_fin >= CURRENT_DATE)
             limit 1;"""
-        try:
-            cursor = self.connection.cursor()
+        with self.cursor() as cursor:
             cursor.execute(query, (promo_id,))
             result = cursor.fetchone()
-            logger.info(f"Promotion data for ID {promo_id}: {result}")
-        finally:
-            cursor.close()
+        logger.info("Promotion data for ID %s: %s", promo_id, result)
 
         if not result:
             return None
 
+        return self._promotion_from_row(result)
+
+    def get_promotions_data(self, promo_ids: List[int]) -> Dict[int, Dict]:
+        """Versión por lotes de get_promotion_data; las promociones no vigentes no aparecen"""
+        ids = list(dict.fromkeys(promo_id for promo_id in promo_ids if promo_id is not None))
+        if not ids:
+            return {}
+        query = """ SELECT DISTINCT ON (pr.id)
+                pr.id,
+                pr.nombre,
+                pr.descripcion,
+                pr.fecha_inicio,
+                pr.fecha_fin,
+                pp.descuento_porcentaje
+            FROM promocion pr
+            JOIN promo_producto pp ON pr.id = pp.promocion_id
+            WHERE pr.id = ANY(%s)
+            AND pr.fecha_inicio <= CURRENT_DATE
+            AND (pr.fecha_fin IS NULL OR pr.fecha_fin >= CURRENT_DATE)
+            ORDER BY pr.id;"""
+        with self.cursor() as cursor:
+            cursor.execute(query, (ids,))
+            results = cursor.fetchall()
+        logger.info("Promotion data for IDs %s: %s vigentes", ids, len(results))
+
+        return {row[0]: self._promotion_from_row(row) for row in results}
+
+    def _promotion_from_row(self, result) -> Dict:
         return {
             'id': result[0],
             'nombre': result[1],
@@ -642,55 +937,109 @@ class DatabaseManager:
         }
 
 
+INTENT_TYPES = ("producto", "categoria", "promocion")
+
+def normalize_intents(intents: List[Dict]) -> List[Dict]:
+    """
+    Limpia los intereses devueltos por el modelo antes de guardarlos: descarta los
+    que no tienen tipo o entidad válidos, acota nivel_interes a [0, 1] y deja uno
+    solo (el de mayor nivel) por conversación, tipo y entidad
+    """
+    best = {}
+    for intent in intents:
+        try:
+            tipo = str(intent['tipo_interes']).strip().lower()
+            entidad_id = int(intent['entidad_id'])
+            nivel = min(max(float(intent['nivel_interes']), 0.0), 1.0)
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"Interés descartado por formato inválido: {intent}")
+            continue
+        if tipo not in INTENT_TYPES:
+            logger.warning(f"Interés descartado por tipo desconocido: {intent}")
+            continue
+        
+        key = (intent['conversacion_id'], tipo, entidad_id)
+        if key not in best or nivel > best[key]['nivel_interes']:
+            best[key] = dict(intent, tipo_interes=tipo, entidad_id=entidad_id, nivel_interes=nivel)
+    
+    return list(best.values())
+
 class ConversationalBot:
     def __init__(self, vector_store, embedding_generator, db_manager=None):
         self.client = OpenAI()
         self.vector_store = vector_store
         self.embedding_generator = embedding_generator
         self.db_manager = db_manager
-        self.conversation_history = {}
+        # El contexto vive en Redis para que todos los workers del webhook lo compartan
+        self.redis = redis.Redis.from_url(config.redis.url)
+        # Hilos para solapar la llamada de embeddings de OpenAI con las consultas a la BD
+        self._executor = ThreadPoolExecutor(max_workers=4)
         
     def get_relevant_products(self, query: str, k: int = 3) -> List[Dict]:
         """Get relevant products based on query"""
-        response = self.client.embeddings.create(
-            input=query,
-            model=self.embedding_generator.model
-        )
-        query_embedding = response.data[0].embedding
+        query_embedding = self.embedding_generator.embed_query(query)
         results = self.vector_store.search(query_embedding, k)
         return results
     
+    def get_relevant_products_batch(self, queries: List[str], k: int = 3) -> List[List[Dict]]:
+        """Relevant products for several queries: one embeddings call and one FAISS search"""
+        query_embeddings = self.embedding_generator.embed_queries(queries)
+        return self.vector_store.search_batch(query_embeddings, k)
+    
+    def _context_key(self, client_id: int) -> str:
+        return f"ctx:{client_id}"
+
+    def _push_context_entries(self, client_id: int, entries: List[Dict], reset: bool = False):
+        """Append entries to the client's Redis context list, keeping it bounded and with TTL"""
+        key = self._context_key(client_id)
+        pipe = self.redis.pipeline(transaction=False)
+        if reset:
+            pipe.delete(key)
+        if entries:
+            pipe.rpush(key, *[orjson.dumps(entry) for entry in entries])
+        pipe.ltrim(key, -config.redis.context_max_messages, -1)
+        pipe.expire(key, config.redis.context_ttl)
+        pipe.execute()
+
+    def load_conversation_context(self, client_id: int, conversation_id: int):
+        """Prime the Redis context from the database when it is not already warm"""
+        if self.redis.exists(self._context_key(client_id)):
+            return
+        
+        db_history = self.db_manager.get_conversation_history(conversation_id)
+        self._push_context_entries(client_id, [{
+            'message': msg['contenido_texto'],
+            'is_bot': msg['is_bot'],
+            'timestamp': msg['fecha']
+        } for msg in db_history], reset=True)
+
     def update_conversation_context(self, client_id: int, message: str, is_bot: bool = False):
         """Update conversation context for a client"""
-        if client_id not in self.conversation_history:
-            self.conversation_history[client_id] = []
-        
-        self.conversation_history[client_id].append({
+        self._push_context_entries(client_id, [{
             'message': message,
             'is_bot': is_bot,
             'timestamp': datetime.now()
-        })
-        
-        if len(self.conversation_history[client_id]) > 10:
-            self.conversation_history[client_id] = self.conversation_history[client_id][-10:]
+        }])
     
     def get_conversation_context(self, client_id: int) -> str:
         """Get conversation context as string"""
-        if client_id not in self.conversation_history:
-            return ""
+        entries = self.redis.lrange(self._context_key(client_id), 0, -1)
         
         context_parts = []
-        for entry in self.conversation_history[client_id]:
+        for raw_entry in entries:
+            entry = orjson.loads(raw_entry)
             role = "Bot" if entry['is_bot'] else "Cliente"
             context_parts.append(f"{role}: {entry['message']}")
         
         return "\n".join(context_parts)
     
-    def generate_response(self, client_id: int, user_message: str) -> str:
+    def generate_response(self, client_id: int, user_message: str,
+                          relevant_products: Optional[List[Dict]] = None) -> str:
         """Generate response using context and relevant products"""
         self.update_conversation_context(client_id, user_message, is_bot=False)
         context = self.get_conversation_context(client_id)
-        relevant_products = self.get_relevant_products(user_message)
+        if relevant_products is None:
+            relevant_products = self.get_relevant_products(user_message)
         
         products_info = []
         for result in relevant_products:
@@ -749,35 +1098,25 @@ class ConversationalBot:
             }
 
         try:
-            client_id = self.db_manager.get_or_create_client(telefono, nombre)
-            conversation_id = self.db_manager.get_or_create_conversation(client_id)
+            received_at = datetime.now()
+            # La búsqueda de productos solo depende del texto: se lanza en paralelo
+            # mientras se resuelven cliente, conversación y contexto
+            products_future = self._executor.submit(self.get_relevant_products, mensaje)
+            client_id, conversation_id = self.db_manager.get_or_create_client_conversation(telefono, nombre)
             
-            self.db_manager.save_message(
-                conversation_id=conversation_id,
-                tipo="text",
-                contenido_texto=mensaje,
-                is_bot=False
-            )
+            # El contexto del turno vive solo en Redis; la BD se lee únicamente
+            # cuando el contexto expiró
+            self.load_conversation_context(client_id, conversation_id)
             
-            db_history = self.db_manager.get_conversation_history(conversation_id)
-            self.conversation_history[client_id] = []
-            for msg in db_history:
-                self.conversation_history[client_id].append({
-                    'message': msg['contenido_texto'],
-                    'is_bot': msg['is_bot'],
-                    'timestamp': msg['fecha']
-                })
-            
-            bot_response = self.generate_response(client_id, mensaje)
+            bot_response = self.generate_response(client_id, mensaje, products_future.result())
             
             logger.info(f"Client {client_id} sent message: {mensaje}")
 
-            self.db_manager.save_message(
-                conversation_id=conversation_id,
-                tipo="text",
-                contenido_texto=bot_response,
-                is_bot=True
-            )
+            # Persistencia de ambos mensajes del turno en un único INSERT
+            self.db_manager.save_messages([
+                ("text", mensaje, None, None, None, received_at, False, conversation_id),
+                ("text", bot_response, None, None, None, datetime.now(), True, conversation_id)
+            ])
             
             return {
                 'success': True,
@@ -795,6 +1134,96 @@ class ConversationalBot:
                 'response': "Lo siento, ha ocurrido un error procesando tu mensaje."
             }
 
+    def process_message_batch(self, items: List[tuple], on_stored=None, on_result=None) -> List:
+        """
+        Procesa un lote de mensajes entrantes (telefono, mensaje, nombre, received_at).
+        Los mensajes entrantes se guardan primero con un único INSERT y se avisa con
+        on_stored(stored), una lista de bools alineada con items: False para los
+        mensajes que no se guardaron. Las respuestas (al último mensaje de cada
+        cliente, con los anteriores ya en el contexto) se generan en el executor sin
+        bloquear al que llama; cada una se guarda y se entrega con on_result(result)
+        en cuanto está lista. Devuelve los futures de esas respuestas
+        """
+        grouped = {}
+        for index, (telefono, mensaje, nombre, received_at) in enumerate(items):
+            grouped.setdefault(telefono, []).append((mensaje, nombre, received_at, index))
+        
+        # Búsqueda de productos para el último mensaje de cada cliente en un solo
+        # lote, en paralelo con las consultas a la BD de cada cliente
+        last_messages = [mensajes[-1][0] for mensajes in grouped.values()]
+        products_future = self._executor.submit(self.get_relevant_products_batch, last_messages)
+        
+        stored = [False] * len(items)
+        conversations = {}
+        rows = []
+        for telefono, mensajes in grouped.items():
+            try:
+                client_id, conversation_id = self.db_manager.get_or_create_client_conversation(telefono, mensajes[-1][1])
+                # El contexto se carga antes de guardar el lote: si viene de la BD no
+                # debe incluir estos mensajes, que se añaden al responder
+                self.load_conversation_context(client_id, conversation_id)
+            except Exception as e:
+                logger.error(f"Error processing message from {telefono}: {e}")
+                continue
+            conversations[telefono] = (client_id, conversation_id)
+            for mensaje, _, received_at, _ in mensajes:
+                rows.append(("text", mensaje, None, None, None, received_at, False, conversation_id))
+        
+        try:
+            if rows:
+                self.db_manager.save_messages(rows)
+        except Exception as e:
+            logger.error(f"Error saving message batch: {e}")
+            conversations.clear()
+        for telefono in conversations:
+            for _, _, _, index in grouped[telefono]:
+                stored[index] = True
+        if on_stored:
+            on_stored(stored)
+        if not conversations:
+            products_future.cancel()
+            return []
+        
+        def respond(position, telefono, mensajes):
+            client_id, conversation_id = conversations[telefono]
+            try:
+                for mensaje, _, _, _ in mensajes[:-1]:
+                    self.update_conversation_context(client_id, mensaje, is_bot=False)
+                
+                mensaje = mensajes[-1][0]
+                bot_response = self.generate_response(client_id, mensaje, products_future.result()[position])
+                logger.info("Client %s sent %s message(s), last: %s", client_id, len(mensajes), mensaje)
+                self.db_manager.save_messages([
+                    ("text", bot_response, None, None, None, datetime.now(), True, conversation_id)
+                ])
+                result = {
+                    'success': True,
+                    'telefono': telefono,
+                    'response': bot_response,
+                    'client_id': client_id,
+                    'conversation_id': conversation_id
+                }
+            except Exception as e:
+                error_msg = f"Error processing message: {str(e)}"
+                logger.error(error_msg)
+                result = {
+                    'success': False,
+                    'telefono': telefono,
+                    'error': error_msg,
+                    'response': "Lo siento, ha ocurrido un error procesando tu mensaje."
+                }
+            if on_result:
+                on_result(result)
+            return result
+        
+        # Una llamada al modelo por cliente, en paralelo: cada cliente recibe su
+        # respuesta sin esperar a los demás del lote, y el que llama no espera a ninguna
+        return [
+            self._executor.submit(respond, position, telefono, mensajes)
+            for position, (telefono, mensajes) in enumerate(grouped.items())
+            if telefono in conversations
+        ]
+
     def analyze_conversation_intent(self, cliente_id: int, k: int = 15):
         """
         Analiza las intenciones de todas las conversaciones de un cliente
@@ -871,24 +1300,22 @@ class ConversationalBot:
                 # Extraer categorías únicas y promociones
                 categorias_unicas = {}
                 promociones_unicas = {}
-                prods_promo = {}
-                categorias_str = ""
+                prods_promo = defaultdict(list)
+                categorias_parts = []
                 for p in productos_info:
                     if p['categoria_id'] and p['categoria_id'] not in categorias_unicas:
                         categorias_unicas[p['categoria_id']] = p['categoria']
-                        categorias_str += f"Id: {p['categoria_id']}, Nombre: {p['categoria']}.\n"
-                    if p['promociones']:
-                        for promo in p['promociones']:
-                            if prods_promo.get(promo['id']) is None:
-                                prods_promo[promo['id']] = f"Producto: {p['nombre']} - {promo.get('descuento_porcentaje', 0)}%, "
-                            else:
-                                prods_promo[promo['id']] += f"Producto: {p['nombre']} - {promo.get('descuento_porcentaje', 0)}%, "
-                            promociones_unicas[promo['id']] = {
-                                'id': promo['id'],
-                                'nombre': promo['nombre'],
-                                'productos_descuento': prods_promo[promo['id']],
-                                'descripcion': promo.get('descripcion', '')
-                            }
+                        categorias_parts.append(f"Id: {p['categoria_id']}, Nombre: {p['categoria']}.")
+                    for promo in p['promociones']:
+                        prods_promo[promo['id']].append(f"Producto: {p['nombre']} - {promo.get('descuento_porcentaje', 0)}%, ")
+                        promociones_unicas[promo['id']] = {
+                            'id': promo['id'],
+                            'nombre': promo['nombre'],
+                            'descripcion': promo.get('descripcion', '')
+                        }
+                for promo_id, promo in promociones_unicas.items():
+                    promo['productos_descuento'] = "".join(prods_promo[promo_id])
+                categorias_str = "\n".join(categorias_parts)
                 logger.info(f"categorias_unicas: {categorias_unicas}")
                 logger.info(f"promociones_unicas: {promociones_unicas}")
 
@@ -945,27 +1372,17 @@ class ConversationalBot:
                         {"role": "user", "content": prompt}
                     ],
                     temperature=0.3,
-                    max_tokens=1000
+                    max_tokens=1000,
+                    response_format={"type": "json_object"}
                 )
                 
-                # Extraer y procesar la respuesta
-                result_text = response.choices[0].message.content.strip()
+                # Con response_format json_object el contenido ya es un objeto JSON
+                result_text = response.choices[0].message.content
                 
                 try:
-                    import re
-                    import json
-                    
-                    # Buscar el JSON en la respuesta
-                    json_match = re.search(r'({[\s\S]*})', result_text)
-                    if json_match:
-                        result_text = json_match.group(1)
-                    
-                    result = json.loads(result_text)
+                    result = orjson.loads(result_text)
                     
-                    # Verificar formato y agregar conversacion_id
                     intents = result.get('intereses', [])
-                    if isinstance(result, list):
-                        intents = result
                     
                     # Agregar conversacion_id a cada interés
                     for intent in intents:
@@ -973,7 +1390,7 @@ class ConversationalBot:
                     
                     all_intents.extend(intents)
                     
-                except json.JSONDecodeError as e:
+                except orjson.JSONDecodeError as e:
                     logger.error(f"Error al decodificar JSON de OpenAI para conversación {conversacion_id}: {e}, respuesta: {result_text}")
                     continue
             
@@ -989,7 +1406,7 @@ class ConversationalBot:
         """
         try:
             # Analizar intenciones
-            intents = self.analyze_conversation_intent(cliente_id)
+            intents = normalize_intents(self.analyze_conversation_intent(cliente_id))
             
             if not intents:
                 logger.info(f"No se encontraron intenciones para el cliente {cliente_id}")
@@ -1009,8 +1426,13 @@ class ConversationalBot:
 
 # pa pruebas
 class WhatsAppBotAPI:
-    def __init__(self, bot: ConversationalBot):
+    def __init__(self, bot: ConversationalBot, last_turns_size: int = 256, retry_window: float = 5.0):
         self.bot = bot
+        # Último turno por teléfono: un reintento idéntico dentro de retry_window
+        # segundos devuelve la misma respuesta; pasado ese tiempo es un mensaje nuevo
+        self.last_turns_size = last_turns_size
+        self.retry_window = retry_window
+        self._last_turns = OrderedDict()
     
     def webhook_handler(self, webhook_data: Dict) -> Dict:
         """Handle incoming WhatsApp webhook"""
@@ -1022,27 +1444,69 @@ class WhatsAppBotAPI:
             if not telefono or not mensaje:
                 return {'success': False, 'error': 'Missing required data'}
             
+            last_turn = self._last_turns.get(telefono)
+            if (last_turn and last_turn[0] == mensaje
+                    and time.monotonic() - last_turn[2] <= self.retry_window):
+                self._last_turns.move_to_end(telefono)
+                return last_turn[1]
+            
             result = self.bot.process_client_message(telefono, mensaje, nombre)
             
             if result['success']:
                 print('response:', result['response'])
+                self._last_turns[telefono] = (mensaje, result, time.monotonic())
+                self._last_turns.move_to_end(telefono)
+                if len(self._last_turns) > self.last_turns_size:
+                    self._last_turns.popitem(last=False)
             
             return result
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-# Hacer el embedding
-def setup_complete_system():
-    """Complete setup of the e-commerce chatbot system"""
+def refresh_views():
+    """Refresh materialized views (run daily, e.g. from cron)"""
+    print("Refreshing materialized views...")
+    db_manager = DatabaseManager(config.database)
+    db_manager.connect()
+    try:
+        db_manager.refresh_product_view()
+        db_manager.refresh_analytics_views()
+    finally:
+        db_manager.disconnect()
+
+def migrate_database():
+    """Apply idempotent schema migrations"""
+    print("Applying database migrations...")
+    db_manager = DatabaseManager(config.database)
+    db_manager.connect()
+    try:
+        db_manager.apply_migrations()
+    finally:
+        db_manager.disconnect()
+
+_system_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=1)
+def _get_system():
+    """Construye (bot, db_manager, add_generator) una sola vez por proceso"""
+    embedding_gen = EmbeddingGenerator()
     
-    print("Setting up complete e-commerce chatbot system...")
+    # 1. Setup database manager; the pool handshake runs in parallel with the index load
+    db_manager = DatabaseManager(config.database)
+    executor = ThreadPoolExecutor(max_workers=1)
+    connect_future = executor.submit(db_manager.connect)
+    executor.shutdown(wait=False)
     
-    # 1. Extract and generate embeddings
+    # 2. Setup vector store; the embeddings file is only read when the index must be built
+    vector_store = VectorStore()
     try:
-        # Load existing embeddings or create new ones
-        embedding_gen = EmbeddingGenerator()
+        vector_store.load_index(config.files.vector_index_path, read_only=config.vector.read_only)
+        print("Loaded existing vector index")
+    except:
+        print("Creating new vector index...")
         
+        # Load existing embeddings or create new ones
         try:
             embeddings_data = embedding_gen.load_embeddings(config.files.embeddings_file)
             print("Loaded existing embeddings")
@@ -1056,60 +1520,104 @@ def setup_complete_system():
             embeddings_data = embedding_gen.generate_embeddings(products)
             embedding_gen.save_embeddings(embeddings_data, config.files.embeddings_file)
         
-        # 2. Setup vector store
-        vector_store = VectorStore()
-        try:
-            vector_store.load_index(config.files.vector_index_path)
-            print("Loaded existing vector index")
-        except:
-            print("Creating new vector index...")
-            vector_store.add_embeddings(embeddings_data)
-            vector_store.save_index(config.files.vector_index_path)
-        
-        # 3. Setup database manager
-        db_manager = DatabaseManager(config.database)
-        db_manager.connect()
-        
-        # 4. Create enhanced bot
-        bot = ConversationalBot(vector_store, embedding_gen, db_manager)
+        vector_store.add_embeddings(embeddings_data)
+        vector_store.save_index(config.files.vector_index_path)
+        del embeddings_data
+    
+    # 3. Wait for the database pool
+    connect_future.result()
+    
+    # 4. Create enhanced bot
+    bot = ConversationalBot(vector_store, embedding_gen, db_manager)
 
-        # 5. 
-        add_generator = AdvertisementGenerator(vector_store, embedding_gen, db_manager)
+    # 5. 
+    add_generator = AdvertisementGenerator(vector_store, embedding_gen, db_manager)
 
+    return bot, db_manager, add_generator
+
+# Hacer el embedding
+def setup_complete_system():
+    """Complete setup of the e-commerce chatbot system"""
+    
+    print("Setting up complete e-commerce chatbot system...")
+    
+    # El sistema se comparte entre llamadas; un fallo no queda cacheado y se reintenta
+    try:
+        with _system_lock:
+            system = _get_system()
         print("System setup complete!")
-        return bot, db_manager, add_generator
-        # api_handler, 
+        return system
         
     except Exception as e:
         print(f"Error setting up system: {e}")
         return None, None, None
 
 
+def shutdown_complete_system():
+    """Cierra el pool del sistema compartido; la siguiente llamada a setup lo reconstruye"""
+    with _system_lock:
+        if _get_system.cache_info().currsize:
+            _, db_manager, _ = _get_system()
+            db_manager.disconnect()
+        _get_system.cache_clear()
+
+
 # Actualizar los embeddings
 def update_product_embeddings():
     """Update product embeddings"""
     print("Updating product embeddings...")
 
     try:
-        # Extract fresh data
+        # Reuse the previous embeddings for unchanged product texts
+        embedding_gen = EmbeddingGenerator()
+        try:
+            cache = embedding_gen.build_cache(embedding_gen.load_embeddings(config.files.embeddings_file))
+        except FileNotFoundError:
+            cache = {}
+        
+        # Update the existing index in place; it is only built from scratch the
+        # first time or when it was saved without product ids
+        vector_store = VectorStore()
+        try:
+            vector_store.load_index(config.files.vector_index_path)
+        except Exception:
+            print("Creating new vector index...")
+        if not vector_store.is_id_mapped():
+            vector_store = VectorStore()
+        
+        # Stream fresh data batch by batch into the embedder and the vector store;
+        # each batch is written to the embeddings file and dropped before the next
         extractor = DatabaseManager(config.database)
         extractor.connect()
-        products = extractor.extract_products_data()
-        extractor.disconnect()
-        
-        # Generate new embeddings
-        embedding_gen = EmbeddingGenerator()
-        embeddings_data = embedding_gen.generate_embeddings(products)
+        embeddings_tmp = f"{config.files.embeddings_file}.tmp"
+        seen_ids = set()
+        changed_count = 0
+        try:
+            extractor.refresh_product_view()
+            with open(embeddings_tmp, 'wb') as embeddings_file:
+                for products in extractor.iter_products_data():
+                    batch_data = embedding_gen.generate_embeddings(products, cache)
+                    if batch_data:
+                        changed_count += vector_store.upsert_embeddings(batch_data)
+                        embedding_gen.append_embeddings(batch_data, embeddings_file)
+                    seen_ids.update(product.id for product in products)
+                    del batch_data
+                    print(f"Procesados {len(seen_ids)} productos")
+            # Only replace the previous file once every batch is written
+            os.replace(embeddings_tmp, config.files.embeddings_file)
+        finally:
+            extractor.disconnect()
+            if os.path.exists(embeddings_tmp):
+                os.unlink(embeddings_tmp)
+        del cache
         
-        # Save embeddings
-        embedding_gen.save_embeddings(embeddings_data, config.files.embeddings_file)
+        # Products no longer active leave the index
+        vector_store.remove_ids([product_id for product_id in vector_store.metadata if product_id not in seen_ids])
         
-        # Update vector store
-        vector_store = VectorStore()
-        vector_store.add_embeddings(embeddings_data)
+        # Save vector store
         vector_store.save_index(config.files.vector_index_path)
         
-        print(f"Successfully updated embeddings for {len(products)} products")
+        print(f"Successfully updated embeddings for {len(seen_ids)} products ({changed_count} re-indexed)")
         
     except Exception as e:
         print(f"Error updating embeddings: {e}")
@@ -1118,10 +1626,11 @@ def test_conversation_flow():
     """Test the complete conversation flow"""
     print("\n=== PROBANDO LA CONVERSACION ===")
     
-    bot, api_handler, db_manager = setup_complete_system()
+    bot, db_manager, _ = setup_complete_system()
     if not bot:
         print("Failed to setup system")
         return
+    api_handler = WhatsAppBotAPI(bot)
     
     # Simulate WhatsApp messages
     test_messages = [
@@ -1165,30 +1674,26 @@ def test_conversation_flow():
             print(f"Error: {result['error']}")
         
         # Small delay to simulate real conversation
-        import time
-        time.sleep(1)
+        if SIMULATE_DELAY:
+            time.sleep(SIMULATE_DELAY)
     
     # Show conversation history from database
     print("\n=== CONVERSATION HISTORY FROM DATABASE ===")
     try:
         client_id = db_manager.get_or_create_client('+1234567890')
-        conversations = db_manager.get_client_conversations(client_id)
+        conversations = db_manager.get_conversations_with_messages(client_id, last_n=5)
         
         for conv in conversations:
             print(f"\nConversation {conv['id']} - {conv['fecha']}")
             print(f"Description: {conv['descripcion']}")
             print(f"Messages: {conv['message_count']}")
             
-            messages = db_manager.get_conversation_history(conv['id'])
-            for msg in messages[-5:]:  # Show last 5 messages
+            for msg in conv['messages']:  # Last 5 messages
                 role = "Bot" if msg['is_bot'] else "Cliente"
                 print(f"  {role}: {msg['contenido_texto']}")
     
     except Exception as e:
         print(f"Error retrieving conversation history: {e}")
-    
-    finally:
-        db_manager.disconnect()
 
 # Analytics and Reporting
 class ChatAnalytics:
@@ -1197,72 +1702,53 @@ class ChatAnalytics:
     
     def get_conversation_stats(self, days: int = 30) -> Dict:
         """Get conversation statistics"""
-        cursor = self.db_manager.connection.cursor()
-        
-        # Total conversations in last N days
-        cursor.execute("""
-            SELECT COUNT(*) FROM conversacion 
-            WHERE fecha >= CURRENT_DATE - INTERVAL '%s days'
-        """, (days,))
-        total_conversations = cursor.fetchone()[0]
-        
-        # Total messages in last N days
-        cursor.execute("""
-            SELECT COUNT(*) FROM mensaje m
-            JOIN conversacion c ON m.conversacion_id = c.id
-            WHERE c.fecha >= CURRENT_DATE - INTERVAL '%s days'
-        """, (days,))
-        total_messages = cursor.fetchone()[0]
-        
-        # Active clients in last N days
-        cursor.execute("""
-            SELECT COUNT(DISTINCT c.cliente_id) FROM conversacion c
-            WHERE c.fecha >= CURRENT_DATE - INTERVAL '%s days'
-        """, (days,))
-        active_clients = cursor.fetchone()[0]
-        
-        # Most common message types
-        cursor.execute("""
-            SELECT m.tipo, COUNT(*) as count FROM mensaje m
-            JOIN conversacion c ON m.conversacion_id = c.id
-            WHERE c.fecha >= CURRENT_DATE - INTERVAL '%s days'
-            GROUP BY m.tipo
-            ORDER BY count DESC
-        """, (days,))
-        message_types = cursor.fetchall()
-        
-        cursor.close()
+        # Todas las métricas del periodo en un solo round-trip
+        with self.db_manager.cursor(cursor_factory=NamedTupleCursor) as cursor:
+            cursor.execute("""
+                WITH recent AS (
+                    SELECT id, cliente_id FROM conversacion
+                    WHERE fecha >= CURRENT_DATE - make_interval(days => %s::int)
+                ),
+                recent_types AS (
+                    SELECT m.tipo, COUNT(*) as count FROM mensaje m
+                    JOIN recent r ON m.conversacion_id = r.id
+                    GROUP BY m.tipo
+                )
+                SELECT
+                    (SELECT COUNT(*) FROM recent) AS total_conversations,
+                    (SELECT COALESCE(SUM(count), 0)::bigint FROM recent_types) AS total_messages,
+                    (SELECT COUNT(DISTINCT cliente_id) FROM recent) AS active_clients,
+                    (SELECT COALESCE(json_object_agg(tipo, count ORDER BY count DESC), '{}'::json)
+                     FROM recent_types) AS message_types
+            """, (days,))
+            stats = cursor.fetchone()
         
         return {
             'period_days': days,
-            'total_conversations': total_conversations,
-            'total_messages': total_messages,
-            'active_clients': active_clients,
-            'avg_messages_per_conversation': total_messages / max(total_conversations, 1),
-            'message_types': dict(message_types)
+            'total_conversations': stats.total_conversations,
+            'total_messages': stats.total_messages,
+            'active_clients': stats.active_clients,
+            'avg_messages_per_conversation': stats.total_messages / max(stats.total_conversations, 1),
+            'message_types': stats.message_types
         }
     
     def get_popular_queries(self, limit: int = 10) -> List[Dict]:
-        """Get most common user queries"""
-        cursor = self.db_manager.connection.cursor()
-        
-        cursor.execute("""
-            SELECT m.contenido_texto, COUNT(*) as frequency
-            FROM mensaje m
-            JOIN conversacion c ON m.conversacion_id = c.id
-            WHERE m.isBot = FALSE 
-            AND m.contenido_texto IS NOT NULL
-            AND LENGTH(m.contenido_texto) > 5
-            AND c.fecha >= CURRENT_DATE - INTERVAL '30 days'
-            GROUP BY m.contenido_texto
-            ORDER BY frequency DESC
-            LIMIT %s
-        """, (limit,))
-        
-        results = cursor.fetchall()
-        cursor.close()
-        
-        return [{'query': row[0], 'frequency': row[1]} for row in results]
+        """Get most common user queries (last 30 days, as of the last refresh_views run)"""
+        with self.db_manager.cursor(cursor_factory=NamedTupleCursor) as cursor:
+            # El servidor arma la lista de dicts como un único valor JSON
+            cursor.execute("""
+                SELECT COALESCE(json_agg(json_build_object(
+                    'query', contenido_texto,
+                    'frequency', frequency
+                ) ORDER BY frequency DESC), '[]'::json) AS queries
+                FROM (
+                    SELECT contenido_texto, frequency
+                    FROM popular_queries_30d
+                    ORDER BY frequency DESC
+                    LIMIT %s
+                ) top
+            """, (limit,))
+            return cursor.fetchone().queries
 
 
 if __name__ == "__main__":
@@ -1272,11 +1758,17 @@ if __name__ == "__main__":
         command = sys.argv[1]
         
         if command == "setup":
+            migrate_database()
             setup_complete_system()
         elif command == "test":
-            test_conversation_flow()
+            try:
+                test_conversation_flow()
+            finally:
+                shutdown_complete_system()
         elif command == "update_embeddings":
             update_product_embeddings()
+        elif command == "refresh_views":
+            refresh_views()
         elif command == "server":
             bot, api_handler, db_manager = setup_complete_system()
             if bot:
@@ -1284,9 +1776,10 @@ if __name__ == "__main__":
                 print("Starting webhook server on port 5000...")
                 app.run(host='0.0.0.0', port=5000, debug=True)
         else:
-            print("Unknown command. Use: setup, test, update_embeddings, or server")
+            print("Unknown command. Use: setup, test, update_embeddings, refresh_views, or server")
     else:
         print("Usage:")
         print("  python script.py setup - Setup the complete system")
         print("  python script.py update_embeddings - Update product embeddings")
+        print("  python script.py refresh_views - Refresh materialized views")
         print("  python script.py server - Start webhook server")
\ No newline at end of file
@@ -1,73 +1,475 @@
-from reportlab.lib.pagesizes import letter, A4
+from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch, cm, mm
-from reportlab.lib.colors import Color, HexColor, white, black
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle, PageBreak, KeepTogether
+from reportlab.lib.units import cm, mm
+from reportlab.lib.colors import HexColor, white
+from reportlab.platypus import Paragraph, Spacer, Image as RLImage, PageBreak, Flowable
 from reportlab.platypus.frames import Frame
 from reportlab.platypus.doctemplate import PageTemplate, BaseDocTemplate
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT, TA_JUSTIFY
-from reportlab.graphics.shapes import Drawing, Rect, Circle, Line, String
-from reportlab.graphics import renderPDF
-from reportlab.graphics.charts.piecharts import Pie
-from reportlab.graphics.charts.barcharts import VerticalBarChart
-from reportlab.pdfgen import canvas
-from reportlab.lib import utils
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageEnhance
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_JUSTIFY
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen.canvas import Canvas
+from PIL import Image
+from boto3.s3.transfer import TransferConfig
 import tempfile
 import os
 import logging
 from datetime import datetime
 from typing import List, Dict, Optional
-import io
-import requests
 from io import BytesIO
-import urllib.parse
+import copy
+import functools
+import hashlib
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import OrderedDict, namedtuple
+import time
 
 logger = logging.getLogger(__name__)
 
+# Interés normalizado: campos fijos como tupla; el dict original queda en `extra`
+Interest = namedtuple('Interest', 'tipo nombre entidad_id extra')
+
+
+class PILImageFlowable(Flowable):
+    """Flowable que dibuja una imagen PIL vía ImageReader, sin recodificarla a PNG"""
+    
+    def __init__(self, image, width: float, height: float):
+        super().__init__()
+        self._reader = ImageReader(image)
+        self.drawWidth = width
+        self.drawHeight = height
+        self.hAlign = 'CENTER'
+    
+    def wrap(self, availWidth, availHeight):
+        return self.drawWidth, self.drawHeight
+    
+    def draw(self):
+        self.canv.drawImage(self._reader, 0, 0, width=self.drawWidth, height=self.drawHeight, mask='auto')
+
+
+class BrochureLookups:
+    """Productos y promociones memorizados durante un único folleto.
+    
+    Cada construcción crea el suyo y lo pasa a sus workers: el generador se comparte
+    entre peticiones concurrentes y no puede guardar este estado.
+    """
+    
+    def __init__(self, ad_generator):
+        self.ad_generator = ad_generator
+        self.products = {}
+        self.promos = {}
+    
+    def prefetch(self, productos: List[Interest], promociones: List[Interest]):
+        """Carga productos y promociones del folleto en una consulta cada uno"""
+        if productos and hasattr(self.ad_generator, 'get_products_bulk'):
+            self.products.update(
+                self.ad_generator.get_products_bulk([p.nombre for p in productos if p.nombre])
+            )
+        if promociones and hasattr(self.ad_generator, 'get_promotions_bulk'):
+            self.promos.update(
+                self.ad_generator.get_promotions_bulk([p.entidad_id for p in promociones])
+            )
+    
+    def product(self, producto: Dict):
+        """get_product_for_interest memorizado por nombre (la consulta busca por nombre)"""
+        key = producto.get('entidad_nombre') or producto.get('entidad_id')
+        if key in self.products:
+            return self.products[key]
+        product = self.ad_generator.get_product_for_interest(producto)
+        return self.products.setdefault(key, product)
+    
+    def promotion(self, promo_id: int):
+        """get_promotion memorizado por id"""
+        if promo_id in self.promos:
+            return self.promos[promo_id]
+        promo = self.ad_generator.get_promotion(promo_id)
+        return self.promos.setdefault(promo_id, promo)
+
+# Colores de marca: se construyen una sola vez al importar el módulo
+BRAND_COLORS = {
+    'primary': HexColor('#1a73e8'),     # Google Blue
+    'secondary': HexColor('#34a853'),   # Google Green  
+    'accent': HexColor('#ea4335'),      # Google Red
+    'warning': HexColor('#fbbc04'),     # Google Yellow
+    'dark': HexColor('#202124'),        # Dark Gray
+    'light': HexColor('#f8f9fa'),       # Light Gray
+    'white': white
+}
+COVER_GRADIENT = [HexColor(c) for c in ('#1a73e8', '#1557b0', '#0f3c78', '#0a2040')]
+TRANSLUCENT_WHITE = HexColor('#ffffff20')
+TRANSLUCENT_BLACK = HexColor('#00000040')
+# Colores de texto/tabla usados fuera de la paleta de marca
+_C_GREEN = HexColor('#27ae60')
+_C_ORANGE = HexColor('#e67e22')
+_C_DARK = HexColor('#2c3e50')
+_C_SLATE = HexColor('#34495e')
+_C_BLUE = HexColor('#3498db')
+
+_SAMPLE_STYLES = getSampleStyleSheet()
+
+
+COVER_GRADIENT_RGB = tuple(tuple(int(round(c * 255)) for c in color.rgb()) for color in COVER_GRADIENT)
+# Argumentos del documento y del frame principal. Frame guarda estado de maquetación
+# (_y, _atTop) durante build(), así que se reutilizan los argumentos, no los objetos
+DOC_KWARGS = dict(
+    pagesize=A4,
+    rightMargin=15*mm,
+    leftMargin=15*mm,
+    topMargin=20*mm,
+    bottomMargin=20*mm
+)
+FRAME_ARGS = (15*mm, 20*mm, A4[0] - 30*mm, A4[1] - 40*mm)
+
+# Geometría fija de las decoraciones de página, en puntos
+HEADER_LINE = (15*mm, A4[1] - 15*mm, A4[0] - 15*mm, A4[1] - 15*mm)
+FOOTER_LEFT = (15*mm, 10*mm)
+FOOTER_RIGHT = (A4[0] - 15*mm, 10*mm)
+CORNER_TOP_RIGHT = (A4[0] - 10*mm, A4[1] - 10*mm, 2*mm)
+CORNER_BOTTOM_LEFT = (10*mm, 10*mm, 2*mm)
+# Círculos decorativos de la portada: (x, y, radio) en puntos
+COVER_CIRCLES = tuple((A4[0] * (0.1 + i * 0.2), A4[1] * 0.8, 20 + i * 10) for i in range(5))
+
+
+def _build_cover_background() -> bytes:
+    """Rasteriza una vez el degradado de la portada como un PNG diminuto"""
+    # Las bandas se dibujaban de abajo hacia arriba; en PIL la fila 0 es la superior.
+    # 64 px por banda bastan para que el visor no difumine los bordes al estirarla
+    bands = Image.new('RGB', (1, len(COVER_GRADIENT_RGB)))
+    bands.putdata(list(reversed(COVER_GRADIENT_RGB)))
+    bg = bands.resize((8, 64 * len(COVER_GRADIENT_RGB)), Image.NEAREST)
+
+    buffer = BytesIO()
+    bg.save(buffer, format='PNG', optimize=False, compress_level=1)
+    return buffer.getvalue()
+
+
+COVER_BACKGROUND_PNG = _build_cover_background()
+COVER_BACKGROUND = ImageReader(BytesIO(COVER_BACKGROUND_PNG))
+
+# Caché en disco de anuncios renderizados, compartida entre folletos
+AD_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'brochure_ad_cache')
+AD_CACHE_MAX_BYTES = int(os.getenv('AD_CACHE_MAX_MB', '256')) * 1024 * 1024
+# Segundos entre barridos completos; entre medias se lleva la cuenta de bytes escritos
+AD_CACHE_SWEEP_INTERVAL = 60
+# Forma parte de la clave: súbelo al cambiar el diseño de los anuncios para que la
+# caché (que sobrevive a los despliegues en /tmp) no sirva renders antiguos
+AD_TEMPLATE_VERSION = 1
+# Fotos de producto -> JPEG; el anuncio de categoría es mayormente texto y tarjetas -> PNG
+AD_IMAGE_FORMATS = {'promotional': 'JPEG', 'regular': 'JPEG', 'category': 'PNG'}
+AD_IMAGE_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png'}
+JPEG_QUALITY = 85
+# Productos por categoría compartidos entre folletos (muchos clientes piden las mismas)
+CATEGORY_CACHE_SIZE = 256
+CATEGORY_CACHE_TTL = int(os.getenv('CATEGORY_CACHE_TTL', '300'))
+# Densidad a la que se incrustan los anuncios; por encima es peso muerto en el PDF
+AD_IMAGE_DPI = 150
+
+
+def ad_cache_key(template: str, payload: Dict, width: int, height: int) -> str:
+    """Clave de contenido para un anuncio: versión y plantilla, datos que se dibujan y tamaño"""
+    raw = json.dumps(
+        {'version': AD_TEMPLATE_VERSION, 'template': template, 'payload': payload, 'size': [width, height]},
+        sort_keys=True, default=str
+    )
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _make_style(name: str, parent: Optional[str] = None, **kw) -> ParagraphStyle:
+    """Memoiza ParagraphStyle por nombre y atributos (los colores son hashables)"""
+    if parent:
+        kw['parent'] = _SAMPLE_STYLES[parent]
+    return ParagraphStyle(name, **kw)
+
+
+def _build_styles(brand_colors: Dict) -> Dict[str, ParagraphStyle]:
+    """Registro de estilos de párrafo del folleto, construido una sola vez"""
+    return {
+        'title': _make_style(
+            'EnhancedTitle',
+            parent='Heading1',
+            fontSize=36,
+            spaceAfter=20,
+            alignment=TA_CENTER,
+            textColor=brand_colors['white'],
+            fontName='Helvetica-Bold',
+            leading=40,
+            bold=True
+        ),
+        'subtitle': _make_style(
+            'EnhancedSubtitle',
+            parent='Heading2',
+            fontSize=18,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=brand_colors['light'],
+            fontName='Helvetica',
+            leading=22
+        ),
+        'client': _make_style(
+            'EnhancedClient',
+            parent='Normal',
+            fontSize=20,
+            spaceAfter=40,
+            alignment=TA_CENTER,
+            textColor=brand_colors['warning'],
+            fontName='Helvetica-Bold',
+            borderWidth=2,
+            borderColor=brand_colors['warning'],
+            borderPadding=15,
+            borderRadius=10
+        ),
+        'welcome': _make_style(
+            'EnhancedWelcome',
+            parent='Normal',
+            fontSize=12,
+            spaceAfter=25,
+            alignment=TA_JUSTIFY,
+            textColor=brand_colors['light'],
+            fontName='Helvetica',
+            leftIndent=3*cm,
+            rightIndent=3*cm,
+            leading=18,
+            backColor=TRANSLUCENT_BLACK,  # Semi-transparent background
+            borderPadding=20,
+            borderRadius=5
+        ),
+        'date': _make_style(
+            'EnhancedDate',
+            parent='Normal',
+            fontSize=12,
+            alignment=TA_RIGHT,
+            textColor=brand_colors['light'],
+            fontName='Helvetica-Oblique'
+        ),
+        'no_products': _make_style(
+            'EnhancedNoProducts',
+            fontSize=16,
+            alignment=TA_CENTER,
+            textColor=brand_colors['dark'],
+            fontName='Helvetica-Oblique',
+            backColor=brand_colors['light'],
+            borderPadding=20
+        ),
+        'error': _make_style(
+            'ErrorStyle',
+            fontSize=14,
+            alignment=TA_CENTER,
+            textColor=brand_colors['accent'],
+            fontName='Helvetica'
+        ),
+        'section_title_product': _make_style(
+            'SectionTitle',
+            parent='Heading1',
+            fontSize=24,
+            spaceAfter=20,
+            alignment=TA_CENTER,
+            textColor=_C_GREEN,
+            fontName='Helvetica-Bold'
+        ),
+        'section_title_promo': _make_style(
+            'SectionTitle',
+            parent='Heading1',
+            fontSize=24,
+            spaceAfter=20,
+            alignment=TA_CENTER,
+            textColor=_C_ORANGE,
+            fontName='Helvetica-Bold'
+        ),
+        'thanks': _make_style(
+            'ThanksStyle',
+            parent='Heading1',
+            fontSize=28,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=_C_DARK,
+            fontName='Helvetica-Bold'
+        ),
+        'contact': _make_style(
+            'ContactStyle',
+            parent='Normal',
+            fontSize=14,
+            spaceAfter=15,
+            alignment=TA_CENTER,
+            textColor=_C_SLATE,
+            fontName='Helvetica'
+        ),
+        'final': _make_style(
+            'FinalStyle',
+            parent='Normal',
+            fontSize=16,
+            alignment=TA_CENTER,
+            textColor=_C_BLUE,
+            fontName='Helvetica-Bold'
+        ),
+        'social': _make_style(
+            'SocialStyle',
+            parent='Normal',
+            fontSize=14,
+            spaceAfter=20,
+            alignment=TA_CENTER,
+            textColor=_C_ORANGE,
+            fontName='Helvetica'
+        ),
+        'section_title_accent': _make_style(
+            'EnhancedSectionTitle',
+            fontSize=28,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=brand_colors['accent'],
+            fontName='Helvetica-Bold'
+        ),
+        'section_title_secondary': _make_style(
+            'EnhancedSectionTitle',
+            fontSize=28,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=brand_colors['secondary'],
+            fontName='Helvetica-Bold'
+        ),
+    }
+
+
+STYLES = _build_styles(BRAND_COLORS)
+
+# Datos de contacto de la contraportada
+CONTACT_INFO = (
+    "📞 Teléfono: +141 55238886",
+    "📧 Email: ventas@librosbo.com",
+    "🌐 Web: www.librosbo.com",
+    "📍 Dirección: Av. Principal 123, Ciudad",
+)
+
+
+@functools.lru_cache(maxsize=4)
+def _minimal_brochure_pdf(year: int) -> bytes:
+    """Folleto de una página para clientes sin intereses; no depende del cliente"""
+    buffer = BytesIO()
+    c = Canvas(buffer, pagesize=A4)
+    c.drawImage(COVER_BACKGROUND, 0, 0, width=A4[0], height=A4[1], preserveAspectRatio=False, mask=None)
+    c.setFillColor(TRANSLUCENT_WHITE)
+    for x, y, radius in COVER_CIRCLES:
+        c.circle(x, y, radius, fill=1, stroke=0)
+    c.setFillColor(BRAND_COLORS['white'])
+    c.setFont('Helvetica-Bold', 36)
+    c.drawCentredString(A4[0] / 2, A4[1] / 2 + 2*cm, "CATÁLOGO EXCLUSIVO")
+    c.setFillColor(BRAND_COLORS['light'])
+    c.setFont('Helvetica', 16)
+    c.drawCentredString(A4[0] / 2, A4[1] / 2 - 1*cm, "No hay recomendaciones disponibles por ahora")
+    c.setFont('Helvetica', 8)
+    c.drawString(15*mm, 10*mm, "Página 1")
+    c.drawRightString(A4[0] - 15*mm, 10*mm, f"Catálogo Personalizado - {year}")
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
 class PDFBrochureGenerator:
     def __init__(self, advertisement_generator):
         self.ad_generator = advertisement_generator
-        self.temp_files = [] 
-        self.brand_colors = {
-            'primary': HexColor('#1a73e8'),     # Google Blue
-            'secondary': HexColor('#34a853'),   # Google Green  
-            'accent': HexColor('#ea4335'),      # Google Red
-            'warning': HexColor('#fbbc04'),     # Google Yellow
-            'dark': HexColor('#202124'),        # Dark Gray
-            'light': HexColor('#f8f9fa'),       # Light Gray
-            'white': white
-        }
+        self.temp_files = []  # imágenes intermedias; el PDF final lo borra quien lo pide
+        self.brand_colors = BRAND_COLORS
+        self._styles = STYLES
+        # Colores del callback por página, resueltos una vez
+        self._circle_fill = TRANSLUCENT_WHITE
+        self._primary = self.brand_colors['primary']
+        self._secondary = self.brand_colors['secondary']
+        self._dark = self.brand_colors['dark']
+        self._build_year = datetime.now().year
+        self._build_date_str = datetime.now().strftime("%d de %B de %Y")
+        self._ad_cache_dir = AD_CACHE_DIR
+        # Bytes de la caché según el último barrido más lo escrito desde entonces
+        self._ad_cache_bytes = None
+        self._ad_cache_next_sweep = 0.0
+        self._ad_cache_sweeping = False
+        self._ad_cache_lock = threading.Lock()
+        os.makedirs(self._ad_cache_dir, exist_ok=True)
+        # Los anuncios se renderizan en paralelo (PIL libera el GIL); los flowables
+        # de ReportLab se siguen creando en el hilo principal
+        self._render_executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+        self._category_cache = OrderedDict()
+        self._category_cache_lock = threading.Lock()
+        self._back_page_flowables = self._build_back_page_flowables()
+        # Subida a S3 multiparte y concurrente para folletos grandes
+        self._transfer_config = TransferConfig(
+            multipart_threshold=4 * 1024 * 1024,
+            multipart_chunksize=8 * 1024 * 1024,
+            max_concurrency=8,
+            use_threads=True
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup_temp_files()
+        return False
         
     def create_brochure_for_client(self, client_name: str, client_interests: List[Dict]) -> Optional[str]:
         """Create a complete PDF brochure based on client interests"""
+        # Create temporary PDF file (owned by the caller once returned)
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
+        with temp_file:
+            built = self._build_brochure(client_name, client_interests, temp_file)
+        if built:
+            logger.info("Enhanced PDF brochure created successfully: %s", temp_file.name)
+            return temp_file.name
         try:
-            # Create temporary PDF file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-            pdf_path = temp_file.name
-            temp_file.close()
-            self.temp_files.append(pdf_path)
+            os.unlink(temp_file.name)
+        except OSError:
+            pass
+        return None
+    
+    def create_brochure_buffer(self, client_name: str, client_interests: List[Dict]) -> Optional[BytesIO]:
+        """Create the brochure in memory, ready for save_pdf_to_aws_fileobj"""
+        buffer = BytesIO()
+        if not self._build_brochure(client_name, client_interests, buffer):
+            return None
+        buffer.seek(0)
+        return buffer
+    
+    def _build_brochure(self, client_name: str, client_interests: List[Dict], output) -> bool:
+        """Write the brochure PDF to a writable file object; returns False on failure"""
+        try:
+            # Group interests by type for better organization
+            buckets = {'categoria': [], 'producto': [], 'promocion': []}
+            for raw in client_interests:
+                interest = Interest(raw.get('tipo_interes'), raw.get('entidad_nombre'), raw.get('entidad_id'), raw)
+                bucket = buckets.get(interest.tipo)
+                if bucket is not None:
+                    bucket.append(interest)
+            categorias, productos, promociones = buckets['categoria'], buckets['producto'], buckets['promocion']
             
-            # Create the PDF document with custom page template
-            doc = BaseDocTemplate(
-                pdf_path,
-                pagesize=A4,
-                rightMargin=15*mm,
-                leftMargin=15*mm,
-                topMargin=20*mm,
-                bottomMargin=20*mm
-            )
+            if not (categorias or productos or promociones):
+                self._build_minimal_brochure(client_name, output)
+                return True
+            
+            # Los datos de la BD solo se reutilizan dentro de este folleto
+            lookups = BrochureLookups(self.ad_generator)
+            lookups.prefetch(productos, promociones)
+            
+            # Lanzar todo el renderizado de anuncios antes de maquetar: las tres
+            # secciones se solapan en el mismo executor en vez de ir una tras otra
+            product_ads = self._submit_ads(functools.partial(self._render_product_ad, lookups=lookups), productos)
+            promotion_ads = self._submit_ads(functools.partial(self._render_promotion_ad, lookups=lookups), promociones)
+            category_ads = self._submit_ads(self._render_category_ad, categorias)
+            
+            # Create the PDF document with custom page template; ReportLab writes
+            # straight into the file object, so a BytesIO never touches disk
+            doc = BaseDocTemplate(output, **DOC_KWARGS)
             
             # Create custom page template
-            frame = Frame(
-                15*mm, 20*mm, 
-                A4[0] - 30*mm, A4[1] - 40*mm,
-                id='normal'
-            )
+            frame = Frame(*FRAME_ARGS, id='normal')
             
             template = PageTemplate(id='main', frames=frame, onPage=self._add_page_decorations)
             doc.addPageTemplates([template])
             
+            # Fecha del folleto: se calcula una vez, no en cada página
+            build_time = datetime.now()
+            self._build_year = build_time.year
+            self._build_date_str = build_time.strftime("%d de %B de %Y")
+            
             # Build the story (content)
             story = []
             
@@ -75,23 +477,14 @@ class PDFBrochureGenerator:
             story.extend(self._create_cover_page(client_name))
             story.append(PageBreak())
             
-            # Group interests by type for better organization
-            categorias = [i for i in client_interests if i.get('tipo_interes') == 'categoria']
-            productos = [i for i in client_interests if i.get('tipo_interes') == 'producto']
-            promociones = [i for i in client_interests if i.get('tipo_interes') == 'promocion']
-            
-            # Add table of contents
-            # story.extend(self._create_table_of_contents(categorias, productos, promociones))
-            # story.append(PageBreak())
-            
             if productos:
-                story.extend(self._create_enhanced_product_section(productos))
+                story.extend(self._create_enhanced_product_section(productos, product_ads))
             
             if promociones:
-                story.extend(self._create_promotion_section(promociones))
+                story.extend(self._create_promotion_section(promociones, promotion_ads))
 
             if categorias:
-                story.extend(self._create_category_section(categorias))
+                story.extend(self._create_category_section(categorias, category_ads))
             
             # Add back page
             story.append(PageBreak())
@@ -100,15 +493,19 @@ class PDFBrochureGenerator:
             # Build PDF
             doc.build(story)
             
-            logger.info(f"Enhanced PDF brochure created successfully: {pdf_path}")
-            return pdf_path
+            return True
             
         except Exception as e:
             logger.error(f"Error creating PDF brochure: {e}")
             if hasattr(e, '__traceback__'):
                 import traceback
                 logger.error(traceback.format_exc())
-            return None
+            return False
+    
+    def _build_minimal_brochure(self, client_name: str, output) -> None:
+        """Write the cached one-page brochure used when there is nothing to recommend"""
+        output.write(_minimal_brochure_pdf(datetime.now().year))
+        logger.info("No interests for %s, minimal brochure created", client_name)
     
     def _add_page_decorations(self, canvas, doc):
         """Add decorative elements to each page"""
@@ -119,15 +516,15 @@ class PDFBrochureGenerator:
 
             # Add header line (skip on cover page)
             if doc.page > 1:
-                canvas.setStrokeColor(self.brand_colors['primary'])
+                canvas.setStrokeColor(self._primary)
                 canvas.setLineWidth(3)
-                canvas.line(15*mm, A4[1] - 15*mm, A4[0] - 15*mm, A4[1] - 15*mm)
+                canvas.line(*HEADER_LINE)
             
             # Add footer
             canvas.setFont('Helvetica', 8)
-            canvas.setFillColor(self.brand_colors['dark'])
-            canvas.drawString(15*mm, 10*mm, f"Página {doc.page}")
-            canvas.drawRightString(A4[0] - 15*mm, 10*mm, f"Catálogo Personalizado - {datetime.now().year}")
+            canvas.setFillColor(self._dark)
+            canvas.drawString(*FOOTER_LEFT, f"Página {doc.page}")
+            canvas.drawRightString(*FOOTER_RIGHT, f"Catálogo Personalizado - {self._build_year}")
             
             # Add corner decorations
             if doc.page > 1:
@@ -140,20 +537,16 @@ class PDFBrochureGenerator:
     def _draw_cover_background(self, canvas):
         """Draw background directly on canvas"""
         try:
-            # Background gradient effect
-            colors = ['#1a73e8', '#1557b0', '#0f3c78', '#0a2040']
-            rect_height = A4[1] / len(colors)
-            
-            for i, color_hex in enumerate(colors):
-                canvas.setFillColor(HexColor(color_hex))
-                canvas.rect(0, i * rect_height, A4[0], rect_height, fill=1, stroke=0)
+            # Degradado pre-rasterizado estirado a toda la página
+            canvas.drawImage(
+                COVER_BACKGROUND,
+                0, 0, width=A4[0], height=A4[1],
+                preserveAspectRatio=False, mask=None
+            )
             
             # Add decorative circles
-            for i in range(5):
-                canvas.setFillColor(HexColor('#ffffff20'))  # Transparent white
-                x = A4[0] * (0.1 + i * 0.2)
-                y = A4[1] * 0.8
-                radius = 20 + i * 10
+            canvas.setFillColor(self._circle_fill)  # Transparent white
+            for x, y, radius in COVER_CIRCLES:
                 canvas.circle(x, y, radius, fill=1, stroke=0)
                 
         except Exception as e:
@@ -164,59 +557,21 @@ class PDFBrochureGenerator:
         """Add decorative corner elements"""
         try:
             # Top-right corner
-            canvas.setFillColor(self.brand_colors['primary'])
-            canvas.circle(A4[0] - 10*mm, A4[1] - 10*mm, 2*mm, fill=1, stroke=0)
+            canvas.setFillColor(self._primary)
+            canvas.circle(*CORNER_TOP_RIGHT, fill=1, stroke=0)
             
             # Bottom-left corner  
-            canvas.setFillColor(self.brand_colors['secondary'])
-            canvas.circle(10*mm, 10*mm, 2*mm, fill=1, stroke=0)
+            canvas.setFillColor(self._secondary)
+            canvas.circle(*CORNER_BOTTOM_LEFT, fill=1, stroke=0)
         except Exception as e:
             logger.error(f"Error adding corner decorations: {e}")
 
     def _create_cover_page(self, client_name: str) -> List:
         """Create an attractive cover page"""
         story = []
-        styles = getSampleStyleSheet()
-        
-        # story.append(self._create_cover_background())
-        
-        # Custom styles with better typography
-        title_style = ParagraphStyle(
-            'EnhancedTitle',
-            parent=styles['Heading1'],
-            fontSize=36,
-            spaceAfter=20,
-            alignment=TA_CENTER,
-            textColor=self.brand_colors['white'],
-            fontName='Helvetica-Bold',
-            leading=40,
-            bold=True
-        )
-        
-        subtitle_style = ParagraphStyle(
-            'EnhancedSubtitle',
-            parent=styles['Heading2'],
-            fontSize=18,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=self.brand_colors['light'],
-            fontName='Helvetica',
-            leading=22
-        )
-        
-        client_style = ParagraphStyle(
-            'EnhancedClient',
-            parent=styles['Normal'],
-            fontSize=20,
-            spaceAfter=40,
-            alignment=TA_CENTER,
-            textColor=self.brand_colors['warning'],
-            fontName='Helvetica-Bold',
-            borderWidth=2,
-            borderColor=self.brand_colors['warning'],
-            borderPadding=15,
-            borderRadius=10
-        )
+        title_style = self._styles['title']
+        subtitle_style = self._styles['subtitle']
+        client_style = self._styles['client']
         
         # Add space from top
         story.append(Spacer(1, 6*cm))
@@ -231,21 +586,7 @@ class PDFBrochureGenerator:
         story.append(Paragraph(f"Para: {client_name}", client_style))
         
         # Welcome message with better formatting
-        welcome_style = ParagraphStyle(
-            'EnhancedWelcome',
-            parent=styles['Normal'],
-            fontSize=12,
-            spaceAfter=25,
-            alignment=TA_JUSTIFY,
-            textColor=self.brand_colors['light'],
-            fontName='Helvetica',
-            leftIndent=3*cm,
-            rightIndent=3*cm,
-            leading=18,
-            backColor=HexColor('#00000040'),  # Semi-transparent background
-            borderPadding=20,
-            borderRadius=5
-        )
+        welcome_style = self._styles['welcome']
         story.append(Spacer(1, 1*cm))
         welcome_text = """
         Hemos creado esta colección exclusiva basada en sus preferencias únicas. 
@@ -254,324 +595,96 @@ class PDFBrochureGenerator:
         """
         story.append(Paragraph(welcome_text, welcome_style))
         
-        # Add feature highlights
-        # story.extend(self._create_feature_highlights())
-        
         # Date with better styling
-        date_style = ParagraphStyle(
-            'EnhancedDate',
-            parent=styles['Normal'],
-            fontSize=12,
-            alignment=TA_RIGHT,
-            textColor=self.brand_colors['light'],
-            fontName='Helvetica-Oblique'
-        )
+        date_style = self._styles['date']
         
-        current_date = datetime.now().strftime("%d de %B de %Y")
+        current_date = self._build_date_str
         story.append(Spacer(1, 2*cm))
         story.append(Paragraph(f"📅 {current_date}", date_style))
         
         return story
     
-    def _create_cover_background(self):
-        """Create a background drawing for the cover"""
-        try:
-            drawing = Drawing(A4[0], A4[1])
-            
-            # Background gradient effect using rectangles
-            colors = [
-                HexColor('#1a73e8'),
-                HexColor('#1557b0'), 
-                HexColor('#0f3c78'),
-                HexColor('#0a2040')
-            ]
-            
-            rect_height = A4[1] / len(colors)
-            for i, color in enumerate(colors):
-                rect = Rect(0, i * rect_height, A4[0], rect_height)
-                rect.fillColor = color
-                rect.strokeColor = None
-                drawing.add(rect)
-            
-            # Add decorative circles
-            for i in range(5):
-                circle = Circle(
-                    A4[0] * (0.1 + i * 0.2), 
-                    A4[1] * 0.8, 
-                    20 + i * 10
-                )
-                circle.fillColor = HexColor('#ffffff20')  # Transparent white
-                circle.strokeColor = None
-                drawing.add(circle)
-            
-            logger.info(f"drawing: {drawing}")
-            # Convert Drawing to image using renderPM
-            img_io = io.BytesIO()
-            renderPM.drawToFile(drawing, img_io, fmt="PNG")
-            img_io.seek(0)
-            pil_img = Image.open(img_io)
-
-            # Convert PIL image to RLImage
-            output_io = io.BytesIO()
-            pil_img.save(output_io, format="PNG")
-            output_io.seek(0)
-            rl_image = RLImage(output_io, width=498, height=716)
-
-            return rl_image
-        except Exception as e:
-            logger.error(f"Error creating cover background: {e}")
-            return Spacer(1, 0)
-    
-    def _create_feature_highlights(self) -> List:
-        """Create feature highlight boxes"""
-        story = []
+    def _submit_ads(self, render, items: List[Interest]) -> List[Future]:
+        """Encola el renderizado de cada anuncio en el executor compartido.
         
-        try:
-            features = [
-                ("🎯", "Selección Personalizada", "Productos elegidos específicamente para usted"),
-                ("💰", "Precios Exclusivos", "Ofertas especiales no disponibles públicamente"),
-                ("⚡", "Disponibilidad Limitada", "Stock reservado por tiempo limitado"),
-                ("🚚", "Envío Prioritario", "Entrega rápida y segura garantizada")
-            ]
-            
-            # Create feature table
-            feature_data = []
-            for i in range(0, len(features), 2):
-                row = []
-                for j in range(2):
-                    if i + j < len(features):
-                        emoji, title, desc = features[i + j]
-                        feature_cell = f"""
-                        <para align='center'>
-                        <font size='24'>{emoji}</font><br/>
-                        <font size='12' color='#fbbc04'><b>{title}</b></font><br/>
-                        <font size='10' color='#f8f9fa'>{desc}</font>
-                        </para>
-                        """
-                        row.append(feature_cell)
-                    else:
-                        row.append("")
-                feature_data.append(row)
-            
-            if feature_data:
-                feature_table = Table(feature_data, colWidths=[9*cm, 9*cm])
-                feature_table.setStyle(TableStyle([
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 10),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-                    ('TOPPADDING', (0, 0), (-1, -1), 15),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
-                    ('BACKGROUND', (0, 0), (-1, -1), HexColor('#ffffff15')),
-                    ('ROUNDEDCORNERS', (0, 0), (-1, -1), [5, 5, 5, 5]),
-                ]))
-                
-                story.append(Spacer(1, 1*cm))
-                story.append(feature_table)
-                
-        except Exception as e:
-            logger.error(f"Error creating feature highlights: {e}")
-            
-        return story
-    
-    def _create_table_of_contents(self, categorias: List, productos: List, promociones: List) -> List:
-        """Create an attractive table of contents"""
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # TOC Title
-        toc_title_style = ParagraphStyle(
-            'TOCTitle',
-            parent=styles['Heading1'],
-            fontSize=28,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=self.brand_colors['primary'],
-            fontName='Helvetica-Bold'
-        )
-        
-        story.append(Paragraph("📋 CONTENIDO", toc_title_style))
-        
-        # TOC Items
-        toc_style = ParagraphStyle(
-            'TOCItem',
-            parent=styles['Normal'],
-            fontSize=16,
-            spaceAfter=15,
-            leftIndent=20,
-            textColor=self.brand_colors['dark'],
-            fontName='Helvetica'
-        )
-        
-        toc_items = []
-        page_num = 3  # Starting page after cover and TOC
-        
-        if categorias:
-            toc_items.append(f"📚 Categorías de Interés ({len(categorias)} categorías) ............ Página {page_num}")
-            page_num += 1
-            
-        if productos:
-            toc_items.append(f"🎯 Productos Recomendados ({len(productos)} productos) .......... Página {page_num}")
-            page_num += 1
-            
-        if promociones:
-            toc_items.append(f"🔥 Promociones Especiales ({len(promociones)} ofertas) ........... Página {page_num}")
-            page_num += 1
-            
-        toc_items.append(f"📞 Información de Contacto ................................. Página {page_num}")
-        
-        for item in toc_items:
-            story.append(Paragraph(item, toc_style))
-        
-        # Add summary statistics
-        story.append(Spacer(1, 2*cm))
-        story.extend(self._create_summary_stats(categorias, productos, promociones))
-        
-        return story
-    
-    def _create_summary_stats(self, categorias: List, productos: List, promociones: List) -> List:
-        """Create visual summary statistics"""
-        story = []
-        
-        try:
-            # Stats title
-            stats_style = ParagraphStyle(
-                'StatsTitle',
-                fontSize=20,
-                spaceAfter=20,
-                alignment=TA_CENTER,
-                textColor=self.brand_colors['secondary'],
-                fontName='Helvetica-Bold'
-            )
-            
-            story.append(Paragraph("📊 RESUMEN DE SU SELECCIÓN", stats_style))
-            
-            # Create stats boxes
-            stats_data = [[
-                self._create_stat_box("📚", len(categorias), "Categorías", self.brand_colors['primary']),
-                self._create_stat_box("🎯", len(productos), "Productos", self.brand_colors['secondary']),
-                self._create_stat_box("🔥", len(promociones), "Promociones", self.brand_colors['accent'])
-            ]]
-            
-            stats_table = Table(stats_data, colWidths=[6*cm, 6*cm, 6*cm])
-            stats_table.setStyle(TableStyle([
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 10),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-                ('TOPPADDING', (0, 0), (-1, -1), 20),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 20),
-            ]))
-            
-            story.append(stats_table)
-            
-        except Exception as e:
-            logger.error(f"Error creating summary stats: {e}")
-            
-        return story
-    
-    def _create_stat_box(self, emoji: str, number: int, label: str, color) -> str:
-        """Create individual stat box"""
-        return f"""
-        <para align='center'>
-        <font size='24'>{emoji}</font><br/>
-        <font size='32' color='{color}'><b>{number}</b></font><br/>
-        <font size='14' color='#202124'><b>{label}</b></font>
-        </para>
+        Intereses repetidos (misma entidad) comparten un único render.
         """
+        submitted = {}
+        futures = []
+        for item in items:
+            key = (item.entidad_id, item.nombre)
+            future = submitted.get(key)
+            if future is None:
+                future = submitted[key] = self._render_executor.submit(render, item)
+            futures.append(future)
+        return futures
     
-    def _create_category_section(self, categorias: List[Dict]) -> List:
+    def _create_category_section(self, categorias: List[Interest], ad_futures: Optional[List[Future]] = None) -> List:
         """Create enhanced category section with better layout"""
         story = []
         
-        section_title_style = ParagraphStyle(
-            'EnhancedSectionTitle',
-            fontSize=28,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=self.brand_colors['accent'],
-            fontName='Helvetica-Bold',
-            # borderWidth=1,
-            # borderColor=self.brand_colors['accent'],
-            # borderPadding=15,
-            # backColor=self.brand_colors['light']
-        )
+        section_title_style = self._styles['section_title_accent']
         
         story.append(Paragraph("📚 CATEGORÍAS DE INTERÉS", section_title_style))
         story.append(Spacer(1, 0.3*cm))
         
-        for i, categoria in enumerate(categorias):
+        if ad_futures is None:
+            ad_futures = self._submit_ads(self._render_category_ad, categorias)
+        for i, ad_future in enumerate(ad_futures):
             if i > 0:
                 story.append(Spacer(1, 0.3*cm))
-            story.extend(self._create_enhanced_category_page(categoria))
+            story.extend(self._create_enhanced_category_page(ad_future))
         
         return story
     
-    def _create_enhanced_category_page(self, categoria: Dict) -> List:
+    def _render_category_ad(self, categoria: Interest):
+        """Worker: cached ad path or in-memory ad for the category; None if it has no products"""
+        category_name = categoria.nombre or 'Categoría'
+        
+        # Get products from this category
+        products = self._get_category_products_safe(category_name, limit=6)
+        if not products:
+            return None
+        
+        fmt = AD_IMAGE_FORMATS['category']
+        key = ad_cache_key('category', {'categoria': category_name, 'productos': products}, 1000, 700)
+        cached_path = self._ad_cache_lookup(key, fmt)
+        if cached_path:
+            return cached_path
+        
+        ad_image = self.ad_generator.create_category_promotion_ad(
+            category_name=category_name,
+            products=products,
+            output_path=None,
+            width=1000,
+            height=700
+        )
+        buffer = self._encode_ad_image(ad_image, fmt)
+        self._ad_cache_store(key, fmt, buffer.getvalue())
+        logger.info("categoria: %s", category_name)
+        logger.info("ad_image : %s", ad_image)
+        return buffer
+    
+    def _create_enhanced_category_page(self, ad_future: Future) -> List:
         """Create enhanced category page with better product display"""
         story = []
         
         try:
-            # Category header with improved styling
-            # cat_title_style = ParagraphStyle(
-            #     'EnhancedCategoryTitle',
-            #     fontSize=22,
-            #     spaceAfter=20,
-            #     alignment=TA_LEFT,
-            #     textColor=self.brand_colors['primary'],
-            #     fontName='Helvetica-Bold',
-            #     borderWidth=1,
-            #     borderColor=self.brand_colors['primary'],
-            #     borderPadding=15,
-            #     backColor=HexColor('#e3f2fd'),
-            #     leftIndent=10
-            # )
-            
-            category_name = categoria.get('entidad_nombre', 'Categoría')
-            # story.append(Paragraph(f"🏷️ {category_name.upper()}", cat_title_style))
+            ad_source = ad_future.result()
             
-            # Get products from this category
-            products = self._get_category_products_safe(category_name, limit=6)
-            
-            if products:
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-                output_path = temp_file.name
-                temp_file.close()
-                ad_image = self.ad_generator.create_category_promotion_ad(
-                    category_name=category_name,
-                    products=products,
-                    output_path=output_path,
-                    width=1000,
-                    height=700
-                )
-                logger.info(f"categoria: {output_path}")
-                logger.info(f"ad_image : {ad_image}")
-                rl_image = self.convert_image_pil_to_reportlab(ad_image)
-                logger.info(f"rl_image : {rl_image}")
+            if ad_source:
+                rl_image = self._rl_image_from_file(ad_source)
+                logger.info("rl_image : %s", rl_image)
                 story.append(rl_image)
-                #     story.append(products_table)
             else:
                 # Enhanced no products message
-                no_products_style = ParagraphStyle(
-                    'EnhancedNoProducts',
-                    fontSize=16,
-                    alignment=TA_CENTER,
-                    textColor=self.brand_colors['dark'],
-                    fontName='Helvetica-Oblique',
-                    backColor=self.brand_colors['light'],
-                    borderPadding=20
-                )
+                no_products_style = self._styles['no_products']
                 story.append(Paragraph("🔄 Próximamente nuevos productos en esta categoría...", no_products_style))
                 
         except Exception as e:
             logger.error(f"Error creating enhanced category page: {e}")
             # Add error message instead of failing silently
-            error_style = ParagraphStyle(
-                'ErrorStyle',
-                fontSize=14,
-                alignment=TA_CENTER,
-                textColor=self.brand_colors['accent'],
-                fontName='Helvetica'
-            )
+            error_style = self._styles['error']
             story.append(Paragraph("⚠️ Error al cargar productos de esta categoría", error_style))
         
         return story
@@ -580,7 +693,7 @@ class PDFBrochureGenerator:
         """Safely get products from category with error handling"""
         try:
             if hasattr(self.ad_generator, 'get_category_products'):
-                return self.ad_generator.get_category_products(category_name, limit=limit)
+                return self._get_category_products_cached(category_name, limit)
             else:
                 # Mock data if method doesn't exist
                 return self._generate_mock_products(category_name, limit)
@@ -588,6 +701,34 @@ class PDFBrochureGenerator:
             logger.warning(f"Could not get products for category {category_name}: {e}")
             return self._generate_mock_products(category_name, limit)
     
+    def _get_category_products_cached(self, category_name: str, limit: int) -> List[Dict]:
+        """get_category_products con caché LRU + TTL por (categoría, límite)"""
+        key = (category_name, limit)
+        now = time.monotonic()
+        with self._category_cache_lock:
+            entry = self._category_cache.get(key)
+            if entry and entry[0] > now:
+                self._category_cache.move_to_end(key)
+                return entry[1]
+        
+        products = self.ad_generator.get_category_products(category_name, limit=limit)
+        if not products:
+            # get_category_products devuelve [] también cuando falla la BD: una lista
+            # vacía no se cachea para no ocultar un fallo transitorio durante el TTL
+            return products
+        
+        with self._category_cache_lock:
+            self._category_cache[key] = (now + CATEGORY_CACHE_TTL, products)
+            self._category_cache.move_to_end(key)
+            while len(self._category_cache) > CATEGORY_CACHE_SIZE:
+                self._category_cache.popitem(last=False)
+        return products
+    
+    def invalidate_category_cache(self):
+        """Descarta los productos por categoría cacheados (p. ej. tras refrescar el catálogo)"""
+        with self._category_cache_lock:
+            self._category_cache.clear()
+    
     def _generate_mock_products(self, category_name: str, limit: int) -> List[Dict]:
         """Generate mock products for testing"""
         mock_products = []
@@ -601,120 +742,68 @@ class PDFBrochureGenerator:
             })
         return mock_products
     
-    def _create_enhanced_product_cell(self, product: Dict) -> str:
-        """Create enhanced product cell with better formatting"""
-        try:
-            name = product.get('nombre', 'Producto')
-            # Truncate long names more elegantly
-            if len(name) > 30:
-                name = name[:27] + "..."
-                
-            price = product.get('precio_actual', 0)
-            category = product.get('categoria', 'Sin categoría')
-            
-            # Check for promotions
-            promo_text = ""
-            if product.get('promociones') and len(product['promociones']) > 0:
-                promo = product['promociones'][0]
-                if promo.get('descuento_porcentaje'):
-                    promo_text = f"<br/><font color='#ea4335' size='12'><b>🏷️ {promo['descuento_porcentaje']}% OFF</b></font>"
-            
-            # Enhanced cell design
-            cell_content = f"""
-            <para align='center'>
-            <font size='14' color='#202124'><b>{name}</b></font><br/>
-            <font color='#1a73e8' size='10'>{category}</font><br/><br/>
-            <font color='#34a853' size='16'><b>${price:,.2f}</b></font>
-            {promo_text}
-            </para>
-            """
-            
-            return cell_content
-            
-        except Exception as e:
-            logger.error(f"Error creating enhanced product cell: {e}")
-            return """
-            <para align='center'>
-            <font color='#ea4335'>⚠️ Error al cargar producto</font>
-            </para>
-            """
-    
-    def _create_enhanced_product_section(self, productos: List[Dict]) -> List:
+    def _create_enhanced_product_section(self, productos: List[Interest], ad_futures: Optional[List[Future]] = None) -> List:
         """Create enhanced products section"""
         story = []
         
-        section_title_style = ParagraphStyle(
-            'EnhancedSectionTitle',
-            fontSize=28,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=self.brand_colors['secondary'],
-            fontName='Helvetica-Bold',
-            # borderWidth=2,
-            # borderColor=self.brand_colors['secondary'],
-            # borderPadding=15,
-            # backColor=self.brand_colors['light']
-        )
+        section_title_style = self._styles['section_title_secondary']
         
         story.append(Paragraph("🎯 PRODUCTOS RECOMENDADOS", section_title_style))
         story.append(Spacer(1, 0.3*cm))
         
-        for i, producto in enumerate(productos):
-            story.extend(self._create_enhanced_individual_product_page(producto))
+        if ad_futures is None:
+            ad_futures = self._submit_ads(self._render_product_ad, productos)
+        for ad_future in ad_futures:
+            story.extend(self._create_enhanced_individual_product_page(ad_future))
             story.append(Spacer(1, 0.3*cm))
         
         return story
     
-    def _create_enhanced_individual_product_page(self, producto: Dict) -> List:
+    def _render_product_ad(self, producto: Interest, lookups: Optional[BrochureLookups] = None):
+        """Worker: cached ad path or in-memory ad for one product interest"""
+        product = self._get_product_for_interest_safe(producto.extra, lookups)
+        if not product:
+            return None
+        
+        is_promotional = bool(product.promociones)
+        template, width, height = ('promotional', 900, 700) if is_promotional else ('regular', 800, 600)
+        fmt = AD_IMAGE_FORMATS[template]
+        key = ad_cache_key(template, self._product_cache_payload(product), width, height)
+        cached_path = self._ad_cache_lookup(key, fmt)
+        if cached_path:
+            return cached_path
+
+        if is_promotional:
+            ad_image = self.ad_generator.create_promotional_product_ad(
+                product=product,
+                output_path=None,
+                width=width,
+                height=height
+            )
+        else:
+            ad_image = self.ad_generator.create_regular_product_ad(
+                product=product,
+                output_path=None,
+                width=width,
+                height=height
+            )
+        buffer = self._encode_ad_image(ad_image, fmt)
+        self._ad_cache_store(key, fmt, buffer.getvalue())
+
+        logger.info("ad_image : %s", ad_image)
+        return buffer
+    
+    def _create_enhanced_individual_product_page(self, ad_future: Future) -> List:
         """Create enhanced individual product page"""
         story = []
         
         try:
-            product = self._get_product_for_interest_safe(producto)
-            if not product:
+            ad_source = ad_future.result()
+            if not ad_source:
                 return story
             
-            # Enhanced product layout
-            # product_data = [[
-            #     self._get_enhanced_product_image_cell(product),
-            #     self._get_enhanced_product_details_cell(product)
-            # ]]
-            
-            # product_table = Table(product_data, colWidths=[8*cm, 10*cm])
-            # product_table.setStyle(TableStyle([
-            #     ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            #     ('LEFTPADDING', (0, 0), (-1, -1), 15),
-            #     ('RIGHTPADDING', (0, 0), (-1, -1), 15),
-            #     ('TOPPADDING', (0, 0), (-1, -1), 15),
-            #     ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
-            #     ('BOX', (0, 0), (-1, -1), 2, self.brand_colors['primary']),
-            #     ('BACKGROUND', (0, 0), (-1, -1), HexColor('#f8f9fa')),
-            #     ('ROUNDEDCORNERS', (0, 0), (-1, -1), [10, 10, 10, 10]),
-            # ]))
-            
-            # story.append(KeepTogether([product_table]))
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-            temp_path = temp_file.name
-            temp_file.close()
-
-            if product.promociones and len(product.promociones) > 0:
-                ad_image = self.ad_generator.create_promotional_product_ad(
-                    product=product,
-                    output_path=temp_path,
-                    width=900,
-                    height=700
-                )
-            else:
-                ad_image = self.ad_generator.create_regular_product_ad(
-                    product=product,
-                    output_path=temp_path,
-                    width=800,
-                    height=600
-                )
-
-            logger.info(f"ad_image : {ad_image}, temp_path: {temp_path}")
-            rl_image = self.convert_image_pil_to_reportlab(ad_image)
-            logger.info(f"rl_image : {rl_image}")
+            rl_image = self._rl_image_from_file(ad_source)
+            logger.info("rl_image : %s", rl_image)
             story.append(rl_image)
             
         except Exception as e:
@@ -722,11 +811,13 @@ class PDFBrochureGenerator:
         
         return story
     
-    def _get_product_for_interest_safe(self, producto: Dict):
+    def _get_product_for_interest_safe(self, producto: Dict, lookups: Optional[BrochureLookups] = None):
         """Safely get product for interest"""
         try:
             if hasattr(self.ad_generator, 'get_product_for_interest'):
-                return self.ad_generator.get_product_for_interest(producto)
+                if lookups is None:
+                    return self.ad_generator.get_product_for_interest(producto)
+                return lookups.product(producto)
             else:
                 # Return mock product data
                 return {
@@ -741,134 +832,180 @@ class PDFBrochureGenerator:
             logger.warning(f"Could not get product for interest: {e}")
             return None
     
-    def _dict_to_product_info_safe(self, product_dict):
-        """Safely convert dict to product info"""
+    def _product_cache_payload(self, product) -> Dict:
+        """Campos del producto que influyen en el anuncio renderizado"""
+        return {
+            'id': getattr(product, 'id', None),
+            'nombre': product.nombre,
+            'descripcion': product.descripcion,
+            'categoria': product.categoria,
+            'precio_actual': product.precio_actual,
+            'promociones': product.promociones,
+            'imagenes': product.imagenes,
+        }
+
+    def _ad_cache_path(self, key: str, fmt: str) -> str:
+        return os.path.join(self._ad_cache_dir, key + AD_IMAGE_EXTENSIONS[fmt])
+
+    def _ad_cache_lookup(self, key: str, fmt: str) -> Optional[str]:
+        """Devuelve la ruta del anuncio cacheado y lo marca como usado recientemente"""
+        path = self._ad_cache_path(key, fmt)
         try:
-            if hasattr(self.ad_generator, 'dict_to_product_info'):
-                return self.ad_generator.dict_to_product_info(product_dict)
-            else:
-                # Create simple object-like structure
-                class ProductInfo:
-                    def __init__(self, data):
-                        self.nombre = data.get('nombre', 'Producto')
-                        self.precio_actual = data.get('precio_actual', 0)
-                        self.categoria = data.get('categoria', 'Sin categoría')
-                        self.descripcion = data.get('descripcion', 'Sin descripción')
-                        self.imagenes = data.get('imagenes', [])
-                        self.promociones = data.get('promociones', [])
-                
-                return ProductInfo(product_dict)
-        except Exception as e:
-            logger.warning(f"Could not convert dict to product info: {e}")
+            os.utime(path)
+        except OSError:
             return None
+        return path
 
-    def _create_product_section(self, productos: List[Dict]) -> List:
-        """Create products section"""
-        story = []
-        styles = getSampleStyleSheet()
-        
-        section_title_style = ParagraphStyle(
-            'SectionTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=20,
-            alignment=TA_CENTER,
-            textColor=HexColor('#27ae60'),
-            fontName='Helvetica-Bold'
-        )
-        
-        story.append(Paragraph("🎯 PRODUCTOS RECOMENDADOS", section_title_style))
-        story.append(Spacer(1, 1*cm))
-        
-        for producto in productos:
-            story.extend(self._create_individual_product_page(producto))
-            story.append(Spacer(1, 1.5*cm))
-        
-        return story
-    
-    def _create_individual_product_page(self, producto: Dict) -> List:
-        """Create detailed page for individual product"""
-        story = []
-        
+    def _ad_cache_store(self, key: str, fmt: str, data: bytes):
+        """Guarda un anuncio recién codificado en la caché (escritura atómica)"""
+        path = self._ad_cache_path(key, fmt)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
         try:
-            product = self.ad_generator.get_product_for_interest(producto)
-            if not product:
-                return story
-            
-            # Create product layout with image and details
-            product_data = [[
-                self._get_product_image_cell(product),
-                self._get_product_details_cell(product)
-            ]]
-            
-            product_table = Table(product_data, colWidths=[8*cm, 10*cm])
-            product_table.setStyle(TableStyle([
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 12),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 12),
-                ('TOPPADDING', (0, 0), (-1, -1), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-                ('BOX', (0, 0), (-1, -1), 1, HexColor('#bdc3c7')),
-                ('BACKGROUND', (0, 0), (-1, -1), HexColor('#f8f9fa')),
-            ]))
-            
-            story.append(product_table)
-            
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._note_ad_cache_write(len(data))
         except Exception as e:
-            logger.error(f"Error creating product page: {e}")
-        
-        return story
+            logger.warning(f"Could not cache ad image {key}: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def _downsample_for_frame(self, ad_image):
+        """Reduce la imagen a AD_IMAGE_DPI para el tamaño con el que se verá en la página"""
+        dpi = ad_image.info.get('dpi', (72, 72))
+        width_pt, height_pt = self._fit_to_frame(ad_image.size, dpi)
+        target_px = int(width_pt / 72 * AD_IMAGE_DPI)
+        if ad_image.width > target_px * 1.1:
+            # reduce() promedia bloques enteros y es mucho más barato que LANCZOS;
+            # el resize final solo cubre el resto no entero
+            factor = ad_image.width // target_px
+            if factor >= 2:
+                ad_image = ad_image.reduce(factor)
+            if ad_image.width > target_px * 1.1:
+                target_height = max(1, int(round(target_px * ad_image.height / ad_image.width)))
+                ad_image = ad_image.resize((target_px, target_height), Image.LANCZOS)
+            # El dpi conserva el tamaño en página de la imagen reducida
+            dpi = (ad_image.width * 72 / width_pt, ad_image.height * 72 / height_pt)
+            ad_image.info['dpi'] = dpi
+        return ad_image, dpi
+
+    def _encode_ad_image(self, ad_image, fmt: str = 'JPEG') -> BytesIO:
+        """Codifica el anuncio una sola vez en memoria"""
+        buffer = BytesIO()
+        ad_image, dpi = self._downsample_for_frame(ad_image)
+        if fmt == 'JPEG':
+            if ad_image.mode in ('RGBA', 'LA', 'P'):
+                # JPEG no tiene canal alfa: se compone sobre blanco
+                rgba = ad_image.convert('RGBA')
+                flattened = Image.new('RGB', rgba.size, 'white')
+                flattened.paste(rgba, mask=rgba.split()[-1])
+                ad_image = flattened
+            elif ad_image.mode != 'RGB':
+                ad_image = ad_image.convert('RGB')
+            ad_image.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=False, dpi=dpi)
+        else:
+            ad_image.save(buffer, format=fmt, dpi=dpi)
+        buffer.seek(0)
+        return buffer
+
+    def _note_ad_cache_write(self, size: int):
+        """Suma lo escrito y barre solo si se pasa del límite o toca el barrido periódico"""
+        with self._ad_cache_lock:
+            if self._ad_cache_bytes is not None:
+                self._ad_cache_bytes += size
+            due = (self._ad_cache_bytes is None
+                   or self._ad_cache_bytes > AD_CACHE_MAX_BYTES
+                   or time.monotonic() >= self._ad_cache_next_sweep)
+            # Un solo hilo barre; el resto sigue escribiendo
+            if not due or self._ad_cache_sweeping:
+                return
+            self._ad_cache_sweeping = True
+        total = None
+        try:
+            total = self._sweep_ad_cache()
+        finally:
+            with self._ad_cache_lock:
+                if total is not None:
+                    self._ad_cache_bytes = total
+                # El barrido periódico recoge también lo que escriben otros procesos
+                self._ad_cache_next_sweep = time.monotonic() + AD_CACHE_SWEEP_INTERVAL
+                self._ad_cache_sweeping = False
     
-    def _create_promotion_section(self, promociones: List[Dict]) -> List:
+    def _sweep_ad_cache(self) -> int:
+        """Elimina los anuncios menos usados cuando la caché supera AD_CACHE_MAX_BYTES;
+        devuelve los bytes que quedan"""
+        entries = []
+        total = 0
+        with os.scandir(self._ad_cache_dir) as it:
+            for entry in it:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        if total <= AD_CACHE_MAX_BYTES:
+            return total
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                continue
+            if total <= AD_CACHE_MAX_BYTES:
+                break
+        return total
+
+    def _create_promotion_section(self, promociones: List[Interest], ad_futures: Optional[List[Future]] = None) -> List:
         """Create promotions section"""
         story = []
-        styles = getSampleStyleSheet()
-        logger.info(f"promociones en _create_promotion_section: {promociones}")
+        logger.info("promociones en _create_promotion_section: %s", promociones)
 
-        section_title_style = ParagraphStyle(
-            'SectionTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=20,
-            alignment=TA_CENTER,
-            textColor=HexColor('#e67e22'),
-            fontName='Helvetica-Bold'
-        )
+        section_title_style = self._styles['section_title_promo']
         
         story.append(Paragraph("🔥 PROMOCIONES ESPECIALES", section_title_style))
         story.append(Spacer(1, 0.3*cm))
         
-        for promocion in promociones:
-            story.extend(self._create_promotion_page(promocion))
+        if ad_futures is None:
+            ad_futures = self._submit_ads(self._render_promotion_ad, promociones)
+        for ad_future in ad_futures:
+            story.extend(self._create_promotion_page(ad_future))
             story.append(Spacer(1, 0.3*cm))
         
         return story
     
-    def _create_promotion_page(self, promocion: Dict) -> List:
+    def _render_promotion_ad(self, promocion: Interest, lookups: Optional[BrochureLookups] = None):
+        """Worker: in-memory promotion banner; None if the promotion no longer exists"""
+        logger.info("promocion in _create_promotion_page: %s", promocion)
+        if lookups is None:
+            promo = self.ad_generator.get_promotion(promocion.entidad_id)
+        else:
+            promo = lookups.promotion(promocion.entidad_id)
+        if not promo:
+            return None
+        
+        logger.info("promo en _create_promotion_page: %s", promo)
+        ad_image = self.ad_generator.create_simple_promotion_banner(
+            promotion_info=promo,
+            output_path=None
+        )
+        logger.info("ad_image : %s", ad_image)
+        ad_image, _ = self._downsample_for_frame(ad_image)
+        return ad_image
+    
+    def _create_promotion_page(self, ad_future: Future) -> List:
         """Create promotion page"""
         story = []
         
         try:
-            logger.info(f"promocion in _create_promotion_page: {promocion}")
-            promo = self.ad_generator.get_promotion(promocion['entidad_id'])
-            if not promo:
+            ad_image = ad_future.result()
+            if ad_image is None:
                 return story
             
-            logger.info(f"promo en _create_promotion_page: {promo}")
-            # product = self.ad_generator.dict_to_product_info(product_info)
-            
-            if promo:
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-                temp_path = temp_file.name
-                temp_file.close()
-                ad_image = self.ad_generator.create_simple_promotion_banner(
-                    promotion_info=promo,
-                    output_path=temp_path
-                )
-                logger.info(f"ad_image : {ad_image}, temp_path: {temp_path}")
-
-                rl_image = self.convert_image_pil_to_reportlab(ad_image)
-                logger.info(f"rl_image : {rl_image}")
+            rl_image = self.convert_image_pil_to_reportlab(ad_image)
+            logger.info("rl_image : %s", rl_image)
+            if rl_image is not None:
                 story.append(rl_image)
                 
         except Exception as e:
@@ -878,129 +1015,36 @@ class PDFBrochureGenerator:
     
     def _create_back_page(self) -> List:
         """Create back page with contact info and thank you message"""
+        # Contenido estático: se parsea una vez y se copia por folleto, porque
+        # ReportLab guarda el estado de maquetación en cada flowable
+        return [copy.copy(flowable) for flowable in self._back_page_flowables]
+    
+    def _build_back_page_flowables(self) -> List:
+        """Flowables de la contraportada (gracias, contacto y redes sociales)"""
         story = []
-        styles = getSampleStyleSheet()
         
         # Add space from top
         story.append(Spacer(1, 3*cm))
         
         # Thank you message
-        thanks_style = ParagraphStyle(
-            'ThanksStyle',
-            parent=styles['Heading1'],
-            fontSize=28,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=HexColor('#2c3e50'),
-            fontName='Helvetica-Bold'
-        )
-        
-        story.append(Paragraph("¡GRACIAS POR ELEGIRNOS!", thanks_style))
+        story.append(Paragraph("¡GRACIAS POR ELEGIRNOS!", self._styles['thanks']))
         
         # Contact information
-        contact_style = ParagraphStyle(
-            'ContactStyle',
-            parent=styles['Normal'],
-            fontSize=14,
-            spaceAfter=15,
-            alignment=TA_CENTER,
-            textColor=HexColor('#34495e'),
-            fontName='Helvetica'
-        )
-        
-        contact_info = [
-            "📞 Teléfono: +141 55238886",
-            "📧 Email: ventas@librosbo.com",
-            "🌐 Web: www.librosbo.com",
-            "📍 Dirección: Av. Principal 123, Ciudad"
-        ]
-        
-        for info in contact_info:
+        contact_style = self._styles['contact']
+        for info in CONTACT_INFO:
             story.append(Paragraph(info, contact_style))
         
         story.append(Spacer(1, 2*cm))
         
         # Final message
-        final_style = ParagraphStyle(
-            'FinalStyle',
-            parent=styles['Normal'],
-            fontSize=16,
-            alignment=TA_CENTER,
-            textColor=HexColor('#3498db'),
-            fontName='Helvetica-Bold'
-        )
-        
-        story.append(Paragraph("Síguenos en nuestras redes sociales para más ofertas", final_style))
+        story.append(Paragraph("Síguenos en nuestras redes sociales para más ofertas", self._styles['final']))
         story.append(Spacer(1, 0.2*cm))
 
         # Social media
-        social_style = ParagraphStyle(
-            'SocialStyle',
-            parent=styles['Normal'],
-            fontSize=14,
-            spaceAfter=20,
-            alignment=TA_CENTER,
-            textColor=HexColor('#e67e22'),
-            fontName='Helvetica'
-        )
-        
-        story.append(Paragraph("instagram: @librosbo | facebook: /librosbo | twitter: @librosbo", social_style))
+        story.append(Paragraph("instagram: @librosbo | facebook: /librosbo | twitter: @librosbo", self._styles['social']))
         
         return story
 
-    def _get_product_image_cell(self, product) -> str:
-        """Get product image for table cell"""
-        try:
-            if product.imagenes and len(product.imagenes) > 0:
-                # Create a placeholder for now - in real implementation you'd process the image
-                return f"""
-                <para align='center'>
-                <b>📷 IMAGEN</b><br/>
-                <font size='10'>Imagen del producto<br/>disponible en línea</font>
-                </para>
-                """
-            else:
-                return """
-                <para align='center'>
-                <b>📦 PRODUCTO</b><br/>
-                <font size='10'>Sin imagen<br/>disponible</font>
-                </para>
-                """
-        except Exception as e:
-            logger.error(f"Error getting product image: {e}")
-            return "Sin imagen"
-    
-    def _get_product_details_cell(self, product) -> str:
-        """Get product details for table cell"""
-        try:
-            description = product.descripcion[:150] + ("..." if len(product.descripcion) > 150 else "") if product.descripcion else "Sin descripción disponible"
-            
-            details = f"""
-            <b><font size='16' color='#2c3e50'>{product.nombre}</font></b><br/><br/>
-            <font color='#3498db'><b>Categoría:</b> {product.categoria}</font><br/><br/>
-            <b>Descripción:</b><br/>
-            {description}<br/><br/>
-            <font color='#27ae60' size='18'><b>Precio: ${product.precio_actual:,.2f}</b></font>
-            """
-            
-            if product.promociones:
-                promo = product.promociones[0]
-                promo_details = f"<br/><br/><font color='#e74c3c'><b>🎉 PROMOCIÓN ESPECIAL</b></font><br/>"
-                if 'nombre' in promo:
-                    promo_details += f"<b>{promo['nombre']}</b><br/>"
-                if 'descuento_porcentaje' in promo:
-                    promo_details += f"<font color='#e74c3c' size='14'><b>{promo['descuento_porcentaje']}% DE DESCUENTO</b></font><br/>"
-                if 'fecha_inicio' in promo and 'fecha_fin' in promo:
-                    promo_details += f"<font size='10'>Válido: {promo['fecha_inicio']} - {promo['fecha_fin']}</font>"
-                
-                details += promo_details
-            
-            return details
-            
-        except Exception as e:
-            logger.error(f"Error getting product details: {e}")
-            return "Detalles no disponibles"
-    
     def save_pdf_to_aws(self, pdf_path: str, client_name: str) -> str:
         """Save PDF brochure to AWS S3"""
         try:
@@ -1014,11 +1058,36 @@ class PDFBrochureGenerator:
                 pdf_path, 
                 'topicos-ads', 
                 key,
-                ExtraArgs={'ContentType': 'application/pdf'}
+                ExtraArgs={'ContentType': 'application/pdf'},
+                Config=self._transfer_config
             )
             
             public_url = f"https://topicos-ads.s3.us-east-1.amazonaws.com/{key}"
-            logger.info(f"PDF brochure uploaded to: {public_url}")
+            logger.info("PDF brochure uploaded to: %s", public_url)
+            
+            return public_url
+            
+        except Exception as e:
+            logger.error(f"Error uploading PDF to AWS: {e}")
+            return None
+    
+    def save_pdf_to_aws_fileobj(self, pdf_buffer: BytesIO, client_name: str) -> Optional[str]:
+        """Stream an in-memory PDF brochure to AWS S3"""
+        try:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"brochure_{client_name.replace(' ', '_')}_{timestamp}.pdf"
+            key = f"brochures/{filename}"
+            
+            self.ad_generator.s3.upload_fileobj(
+                pdf_buffer,
+                'topicos-ads',
+                key,
+                ExtraArgs={'ContentType': 'application/pdf'},
+                Config=self._transfer_config
+            )
+            
+            public_url = f"https://topicos-ads.s3.us-east-1.amazonaws.com/{key}"
+            logger.info("PDF brochure uploaded to: %s", public_url)
             
             return public_url
             
@@ -1030,26 +1099,26 @@ class PDFBrochureGenerator:
         """Clean up temporary files"""
         for temp_file in self.temp_files:
             try:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
+                os.unlink(temp_file)
+            except FileNotFoundError:
+                pass
             except Exception as e:
                 logger.warning(f"Could not delete temp file {temp_file}: {e}")
         self.temp_files.clear()
 
-    def convert_image_pil_to_reportlab(self, ad_image) -> RLImage:
-        if isinstance(ad_image, Image.Image):  # Verifica que sea un objeto PIL.Image
-            buffer = BytesIO()
-            ad_image.save(buffer, format='PNG')
-            buffer.seek(0)
-
-            # Medidas máximas del frame
-            max_width = A4[0] - 30 * mm  # 498.23
-            max_height = A4[1] - 40 * mm  # 716.50
+    def _fit_to_frame(self, size, dpi_info) -> tuple:
+        """Tamaño en puntos de una imagen escalada para caber en el frame"""
+        # Medidas máximas del frame
+        max_width = A4[0] - 30 * mm  # 498.23
+        max_height = A4[1] - 40 * mm  # 716.50
 
-            # Tamaño original de la imagen en píxeles
-            img_width_px, img_height_px = ad_image.size
+        # Tamaño original de la imagen en píxeles
+        img_width_px, img_height_px = size
 
-            dpi_info = ad_image.info.get('dpi', (72, 72))
+        if dpi_info is None or dpi_info == (72, 72):
+            # Caso habitual (sin DPI o 72 DPI): un píxel es un punto
+            img_width_pt, img_height_pt = img_width_px, img_height_px
+        else:
             if len(dpi_info) < 2:
                 dpi_info = (dpi_info[0], dpi_info[0])  # Repetir si solo hay uno
             dpi_x, dpi_y = dpi_info
@@ -1058,15 +1127,41 @@ class PDFBrochureGenerator:
             img_width_pt = img_width_px * 72 / dpi_x
             img_height_pt = img_height_px * 72 / dpi_y
 
-            # Escalar proporcionalmente si excede el tamaño del frame
-            scale_x = max_width / img_width_pt
-            scale_y = max_height / img_height_pt
-            scale = min(scale_x, scale_y, 1.0)  # solo reducir
+        # Escalar proporcionalmente si excede el tamaño del frame
+        scale_x = max_width / img_width_pt
+        scale_y = max_height / img_height_pt
+        scale = min(scale_x, scale_y, 1.0)  # solo reducir
+
+        return img_width_pt * scale, img_height_pt * scale
+
+    def _rl_image_from_file(self, source) -> RLImage:
+        """RLImage desde una ruta o un BytesIO; Image.open solo lee la cabecera"""
+        if hasattr(source, 'getvalue'):
+            # Buffer propio por flowable: un mismo render puede aparecer varias veces
+            source = BytesIO(source.getvalue())
+        with Image.open(source) as img:
+            final_width, final_height = self._fit_to_frame(img.size, img.info.get('dpi'))
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return RLImage(source, width=final_width, height=final_height)
+
+    def convert_image_pil_to_reportlab(self, ad_image) -> Optional[Flowable]:
+        if isinstance(ad_image, Image.Image):  # Verifica que sea un objeto PIL.Image
+            ad_image, dpi = self._downsample_for_frame(ad_image)
+            if ad_image.mode not in ('RGB', 'RGBA', 'L', 'CMYK'):
+                # Paleta u otros modos: ImageReader trabaja mejor con RGBA
+                ad_image = ad_image.convert('RGBA')
+
+            final_width, final_height = self._fit_to_frame(ad_image.size, dpi)
 
-            final_width = img_width_pt * scale
-            final_height = img_height_pt * scale
+            if ad_image.mode in ('RGB', 'L'):
+                # Sin alfa: JPEG se codifica rápido y ReportLab lo incrusta tal cual (DCT)
+                buffer = BytesIO()
+                ad_image.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=False)
+                buffer.seek(0)
+                return RLImage(buffer, width=final_width, height=final_height)
 
-            rl_image = RLImage(buffer, width=final_width, height=final_height)
-            return rl_image
+            # Con transparencia: ImageReader toma las muestras del objeto PIL, sin pasada PNG
+            return PILImageFlowable(ad_image, final_width, final_height)
         else:
             logger.warning("ad_image no es un objeto PIL.Image.Image válido.")
\ No newline at end of file